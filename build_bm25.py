@@ -0,0 +1,14 @@
+"""
+One-time BM25 index builder.
+
+Loading the attraction and restaurant corpora through llm_rag builds a
+persisted BM25 index next to the downloaded embeddings if none exists.
+Run this once after a model download (or bake it into the deploy image)
+so cold starts only pay a pickle load instead of re-tokenizing the
+whole corpus.
+"""
+
+if __name__ == "__main__":
+    from llm_rag import get_indices
+    get_indices()
+    print("✅ BM25 indices built and persisted next to the embeddings")
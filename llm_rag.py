@@ -1,151 +1,380 @@
-import os
-import pickle
-import numpy as np
-import faiss
-from rank_bm25 import BM25Okapi
-from openai import OpenAI
-from langchain_core.documents import Document
-from langchain_core.prompts import PromptTemplate
-from langgraph.graph import StateGraph, END
-from langchain_core.messages import HumanMessage, BaseMessage
-from langchain_openai import ChatOpenAI
-from typing import Annotated, Sequence, TypedDict, List
-from dotenv import load_dotenv
-from huggingface_hub import hf_hub_download
-
-# ===============================
-# LOAD ENVIRONMENT VARIABLES
-# ===============================
-load_dotenv()  # optional locally; Railway injects automatically
-
-OPENAI_KEY = os.getenv("OPENAI_API_KEY")
-TAVILY_KEY = os.getenv("TAVILY_API_KEY")  # if needed
-HF_TOKEN = os.getenv("HF_TOKEN")
-
-# ===============================
-# OPENAI SETUP
-# ===============================
-client = OpenAI(api_key=OPENAI_KEY)
-agent_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.4, api_key=OPENAI_KEY)
-
-# ===============================
-# PATH HELPERS (download files from HF if not present locally)
-# ===============================
-def download_hf_file(repo_id: str, filename: str, local_dir="downloads") -> str:
-    os.makedirs(local_dir, exist_ok=True)
-    local_path = os.path.join(local_dir, os.path.basename(filename))
-    if not os.path.exists(local_path):
-        print(f"📥 Downloading {filename} from Hugging Face...")
-        local_path = hf_hub_download(
-            repo_id=repo_id,
-            filename=filename,
-            token=HF_TOKEN,
-            cache_dir=local_dir
-        )
-        print(f"✅ Downloaded {filename} to {local_path}")
-    return local_path
-
-# ===============================
-# FAISS + BM25 LOAD
-# ===============================
-def load_faiss_bm25(repo_id: str, embeddings_file: str, index_file: str):
-    path_embeddings = download_hf_file(repo_id, embeddings_file)
-    path_index = download_hf_file(repo_id, index_file)
-    
-    with open(path_embeddings, "rb") as f:
-        df = pickle.load(f)
-    index = faiss.read_index(path_index)
-    corpus = df['FAISS_TEXT'].str.lower().str.split().tolist()
-    bm25 = BM25Okapi(corpus)
-    return df, index, bm25
-
-# ===============================
-# DOWNLOAD EMBEDDINGS
-# ===============================
-REPO_ID = "intxnk01/tourgether-models"
-attraction_df, attraction_index, attraction_bm25 = load_faiss_bm25(
-    REPO_ID,
-    "faiss_embeddings_region/attraction_embeddings_region.pkl",
-    "faiss_embeddings_region/faiss_attraction_region_cosine.index"
-)
-restaurant_df, restaurant_index, restaurant_bm25 = load_faiss_bm25(
-    REPO_ID,
-    "faiss_embeddings_region/restaurant_embeddings_region.pkl",
-    "faiss_embeddings_region/faiss_restaurant_region_cosine.index"
-)
-
-# ===============================
-# HYBRID RETRIEVAL
-# ===============================
-def embed_query(text):
-    response = client.embeddings.create(model="text-embedding-3-large", input=text)
-    return np.array(response.data[0].embedding, dtype="float32")
-
-def normalize(scores_dict):
-    if not scores_dict: return {}
-    values = np.array(list(scores_dict.values()))
-    if values.max() == values.min(): return {k: 1.0 for k in scores_dict.keys()}
-    return {k: (v - values.min()) / (values.max() - values.min()) for k, v in scores_dict.items()}
-
-def hybrid_retrieval(query, domain="attraction", top_k=5):
-    df, index, bm25 = (restaurant_df, restaurant_index, restaurant_bm25) if domain=="restaurant" else (attraction_df, attraction_index, attraction_bm25)
-    
-    # FAISS
-    vec = embed_query(query).reshape(1, -1)
-    faiss.normalize_L2(vec)
-    f_scores, f_indices = index.search(vec, 10)
-    f_map = normalize({int(idx): float(sc) for idx, sc in zip(f_indices[0], f_scores[0])})
-    
-    # BM25
-    tokenized_query = query.lower().split()
-    b_scores = bm25.get_scores(tokenized_query)
-    b_indices = np.argsort(b_scores)[::-1][:10]
-    b_map = normalize({int(idx): float(b_scores[idx]) for idx in b_indices})
-    
-    # Hybrid
-    combined = {idx: 0.6*f_map.get(idx,0)+0.4*b_map.get(idx,0) for idx in set(f_map)|set(b_map)}
-    ranked = sorted(combined.items(), key=lambda x:x[1], reverse=True)[:top_k]
-    
-    docs = []
-    for idx, _ in ranked:
-        row = df.iloc[idx]
-        docs.append(Document(
-            page_content=row["FAISS_TEXT"],
-            metadata={"PICTURE": row.get("PICTURE",""), "NAME": row.get("NAME","")}
-        ))
-    return docs
-
-# ===============================
-# GRAPH NODES
-# ===============================
-class AgentState(TypedDict):
-    messages: Annotated[Sequence[BaseMessage], None]
-    query: str
-    documents: List[Document]
-
-def retrieve_node(state: AgentState):
-    query = state["query"]
-    attr_docs = hybrid_retrieval(query, "attraction", top_k=5)
-    rest_docs = hybrid_retrieval(query, "restaurant", top_k=3)
-    return {"documents": attr_docs + rest_docs}
-
-def generate_node(state: AgentState):
-    prompt = PromptTemplate.from_template(
-        "You are a professional travel planner. Create a narrative itinerary for {query}.\n"
-        "Context:\n{context}\nOutput the itinerary with clear Day sections using ### Day X."
-    )
-    context = "\n".join([d.page_content for d in state["documents"]])
-    chain = prompt | agent_llm
-    response = chain.invoke({"query": state["query"], "context": context})
-    return {"messages": [response], "documents": state["documents"]}
-
-# ===============================
-# BUILD GRAPH
-# ===============================
-workflow = StateGraph(AgentState)
-workflow.add_node("retrieve", retrieve_node)
-workflow.add_node("generate", generate_node)
-workflow.set_entry_point("retrieve")
-workflow.add_edge("retrieve", "generate")
-workflow.add_edge("generate", END)
-graph = workflow.compile()
+import asyncio
+import os
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+import faiss
+import bm25s
+from openai import OpenAI
+from langchain_core.documents import Document
+from langgraph.graph import StateGraph, END
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, BaseMessage
+from langchain_openai import ChatOpenAI
+from typing import Annotated, Sequence, TypedDict, List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from dotenv import load_dotenv
+from huggingface_hub import hf_hub_download
+
+# ===============================
+# LOAD ENVIRONMENT VARIABLES
+# ===============================
+load_dotenv()  # optional locally; Railway injects automatically
+
+OPENAI_KEY = os.getenv("OPENAI_API_KEY")
+TAVILY_KEY = os.getenv("TAVILY_API_KEY")  # if needed
+HF_TOKEN = os.getenv("HF_TOKEN")
+
+# ===============================
+# OPENAI SETUP
+# ===============================
+# Operator-tunable knobs (env, no code change needed)
+RAG_CLIENT_TIMEOUT_MS = int(os.getenv("RAG_CLIENT_TIMEOUT_MS", "30000"))
+RAG_TOP_K_ATTR = int(os.getenv("RAG_TOP_K_ATTR", "5"))
+RAG_TOP_K_REST = int(os.getenv("RAG_TOP_K_REST", "3"))
+
+client = OpenAI(api_key=OPENAI_KEY, timeout=RAG_CLIENT_TIMEOUT_MS / 1000)
+agent_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.4, api_key=OPENAI_KEY, streaming=True)
+
+# ===============================
+# PATH HELPERS (download files from HF if not present locally)
+# ===============================
+def download_hf_file(repo_id: str, filename: str, local_dir="downloads") -> str:
+    os.makedirs(local_dir, exist_ok=True)
+    local_path = os.path.join(local_dir, os.path.basename(filename))
+    if not os.path.exists(local_path):
+        print(f"📥 Downloading {filename} from Hugging Face...")
+        local_path = hf_hub_download(
+            repo_id=repo_id,
+            filename=filename,
+            token=HF_TOKEN,
+            cache_dir=local_dir
+        )
+        print(f"✅ Downloaded {filename} to {local_path}")
+    return local_path
+
+# ===============================
+# FAISS + BM25 LOAD
+# ===============================
+def _read_index_mmap(path: str):
+    """
+    Memory-map the index instead of reading it all into RAM: the OS pages
+    in only what search() touches, cutting cold-start IO and RSS. Falls
+    back to a normal read for index types that don't support mmap.
+    """
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+def load_faiss_bm25(repo_id: str, embeddings_file: str, index_file: str):
+    path_embeddings = download_hf_file(repo_id, embeddings_file)
+    path_index = download_hf_file(repo_id, index_file)
+    
+    # Prefer the Parquet sibling (see convert_embeddings_parquet.py):
+    # columnar + Arrow strings deserialize much faster than pickle and
+    # carry only the columns the query path reads
+    parquet_path = os.path.splitext(path_embeddings)[0] + ".parquet"
+    if os.path.exists(parquet_path):
+        df = pd.read_parquet(parquet_path, engine="pyarrow", dtype_backend="pyarrow")
+    else:
+        with open(path_embeddings, "rb") as f:
+            df = pickle.load(f)
+
+    # Prefer migrated siblings (built by migrate_faiss_index.py) over the
+    # flat index: HNSW for sub-linear search, else SQ8 for 4x smaller
+    # vectors and less memory bandwidth per scan
+    hnsw_path = path_index.replace(".index", "_hnsw.index")
+    sq8_path = path_index.replace(".index", "_sq8.index")
+    if os.path.exists(hnsw_path):
+        # HNSW graphs need the full in-RAM load; no mmap
+        index = faiss.read_index(hnsw_path)
+        index.hnsw.efSearch = 64
+    elif os.path.exists(sq8_path):
+        index = _read_index_mmap(sq8_path)
+    else:
+        index = _read_index_mmap(path_index)
+
+    # Load the persisted BM25 index if present; rebuilding it on every cold
+    # start re-tokenizes the whole corpus and recomputes IDF for nothing
+    bm25_pkl = path_embeddings + ".bm25.pkl"
+    if os.path.exists(bm25_pkl):
+        with open(bm25_pkl, "rb") as f:
+            bm25 = pickle.load(f)
+    else:
+        bm25 = bm25s.BM25()
+        bm25.index(bm25s.tokenize(df['FAISS_TEXT'].tolist(), show_progress=False))
+        with open(bm25_pkl, "wb") as f:
+            pickle.dump(bm25, f)
+    return df, index, bm25
+
+# ===============================
+# EMBEDDINGS / INDICES (lazy, shared)
+# ===============================
+REPO_ID = "intxnk01/tourgether-models"
+
+@lru_cache(maxsize=1)
+def get_indices():
+    """
+    Load the per-domain (df, faiss index, bm25) triples once per process
+    and share them across all callers. Lazy so importing this module does
+    not block on downloads, and get_indices.cache_clear() forces a reload.
+    """
+    return {
+        "attraction": load_faiss_bm25(
+            REPO_ID,
+            "faiss_embeddings_region/attraction_embeddings_region.pkl",
+            "faiss_embeddings_region/faiss_attraction_region_cosine.index"
+        ),
+        "restaurant": load_faiss_bm25(
+            REPO_ID,
+            "faiss_embeddings_region/restaurant_embeddings_region.pkl",
+            "faiss_embeddings_region/faiss_restaurant_region_cosine.index"
+        ),
+    }
+
+# ===============================
+# HYBRID RETRIEVAL
+# ===============================
+EMBED_DIM = 3072  # text-embedding-3-large
+
+@lru_cache(maxsize=512)
+def _embed_query_cached(text):
+    response = client.embeddings.create(model="text-embedding-3-large", input=text)
+    return np.array(response.data[0].embedding, dtype="float32")
+
+def embed_query(text):
+    # Copy so callers (faiss.normalize_L2 mutates in place) never touch the cached array
+    return _embed_query_cached(text).copy()
+
+# ===============================
+# SEMANTIC QUERY CACHE
+# ===============================
+# Exact-string caching misses trivial rephrasings ("5 day trip to Tokyo" vs
+# "5-day Tokyo trip"). Keep a small FAISS index of past query embeddings and
+# return the cached docs when cosine similarity >= threshold, skipping the
+# main FAISS search and BM25 scoring entirely.
+QCACHE_SIM_THRESHOLD = 0.95
+QCACHE_MAX = 1024
+
+_qcache_index = faiss.IndexIDMap(faiss.IndexFlatIP(EMBED_DIM))
+_qcache_payload = {}      # cache_id -> (query, domain, top_k, docs)
+_qcache_ids = deque()     # insertion order, for FIFO eviction
+_qcache_next_id = 0
+# The attraction and restaurant retrievals run on _retrieval_pool threads
+# and share this index; FAISS add_with_ids/remove_ids are not safe against
+# concurrent search, so every cache operation serializes on this lock
+_qcache_lock = threading.Lock()
+
+def _qcache_lookup(vec, domain, top_k):
+    """Return cached docs for a semantically equivalent query, else None"""
+    with _qcache_lock:
+        if _qcache_index.ntotal == 0:
+            return None
+        # Every request inserts the same query vector once per domain,
+        # so the nearest neighbors are ties; search a few and take the
+        # first entry stored for this domain instead of letting the
+        # other domain's duplicate shadow the hit at k=1
+        sims, ids = _qcache_index.search(vec, min(4, _qcache_index.ntotal))
+        for sim, cache_id in zip(sims[0], ids[0]):
+            if sim < QCACHE_SIM_THRESHOLD or cache_id < 0:
+                break  # results are sorted, nothing further can match
+            entry = _qcache_payload.get(int(cache_id))
+            if entry is None:
+                continue
+            _, cached_domain, cached_top_k, docs = entry
+            if cached_domain == domain and cached_top_k == top_k:
+                return docs
+        return None
+
+def _qcache_insert(vec, query, domain, top_k, docs):
+    global _qcache_next_id
+    with _qcache_lock:
+        cache_id = _qcache_next_id
+        _qcache_next_id += 1
+        _qcache_index.add_with_ids(vec, np.array([cache_id], dtype="int64"))
+        _qcache_payload[cache_id] = (query, domain, top_k, docs)
+        _qcache_ids.append(cache_id)
+        while len(_qcache_ids) > QCACHE_MAX:
+            old_id = _qcache_ids.popleft()
+            _qcache_index.remove_ids(np.array([old_id], dtype="int64"))
+            _qcache_payload.pop(old_id, None)
+
+def normalize(values):
+    """Min-max normalize a score vector (all-equal collapses to ones)"""
+    if values.size == 0:
+        return values
+    lo, hi = values.min(), values.max()
+    if hi == lo:
+        return np.ones_like(values)
+    return (values - lo) / (hi - lo)
+
+def _faiss_branch(vec, index):
+    """Dense branch: single-vector FAISS search with normalized scores"""
+    f_sims, f_indices = index.search(vec, 10)
+    valid = f_indices[0] >= 0
+    f_ids = f_indices[0][valid].astype(np.int64)
+    f_sc = normalize(f_sims[0][valid].astype(np.float32))
+    return f_ids, f_sc
+
+def _bm25_branch(query, query_tokens, bm25):
+    """Sparse branch (bm25s scores against sparse SciPy matrices and
+    returns top-k directly, instead of rank_bm25's pure-Python loop)"""
+    if query_tokens is None:
+        query_tokens = bm25s.tokenize([query], return_ids=False, show_progress=False)
+    b_results, b_scores = bm25.retrieve(query_tokens, k=10)
+    b_ids = np.asarray(b_results[0], dtype=np.int64)
+    b_sc = normalize(np.asarray(b_scores[0], dtype=np.float32))
+    return b_ids, b_sc
+
+# Dedicated pool for the sparse branch so hybrid_retrieval calls running
+# on _retrieval_pool threads never wait on their own pool (deadlock)
+_branch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25")
+
+def hybrid_retrieval(query, domain="attraction", top_k=5, query_vec=None, query_tokens=None):
+    df, index, bm25 = get_indices()["restaurant" if domain=="restaurant" else "attraction"]
+
+    # FAISS (copy any precomputed vector: normalize_L2 mutates in place)
+    vec = (embed_query(query) if query_vec is None else query_vec.copy()).reshape(1, -1)
+    faiss.normalize_L2(vec)
+
+    # Semantic cache hit skips the main FAISS search and BM25 entirely
+    cached_docs = _qcache_lookup(vec, domain, top_k)
+    if cached_docs is not None:
+        return cached_docs
+
+    # The two branches are independent: BM25 scoring overlaps with the
+    # FAISS search instead of running after it
+    bm25_future = _branch_pool.submit(_bm25_branch, query, query_tokens, bm25)
+    f_ids, f_sc = _faiss_branch(vec, index)
+    b_ids, b_sc = bm25_future.result()
+
+    # Hybrid: vectorized merge instead of set-union + dict comprehension —
+    # scatter both normalized score vectors onto the unique id axis, fuse,
+    # then argpartition the (<=20-wide) combined vector for top-k
+    all_ids = np.unique(np.concatenate([f_ids, b_ids]))
+    fs = np.zeros(len(all_ids), dtype=np.float32)
+    bs = np.zeros(len(all_ids), dtype=np.float32)
+    fs[np.searchsorted(all_ids, f_ids)] = f_sc
+    bs[np.searchsorted(all_ids, b_ids)] = b_sc
+    combined = 0.6 * fs + 0.4 * bs
+    k = min(top_k, len(all_ids))
+    top = np.argpartition(-combined, k - 1)[:k]
+    ranked = all_ids[top[np.argsort(-combined[top])]]
+
+    docs = []
+    for idx in ranked:
+        row = df.iloc[int(idx)]
+        docs.append(Document(
+            page_content=row["FAISS_TEXT"],
+            metadata={"PICTURE": row.get("PICTURE",""), "NAME": row.get("NAME","")}
+        ))
+
+    _qcache_insert(vec, query, domain, top_k, docs)
+    return docs
+
+# ===============================
+# GRAPH NODES
+# ===============================
+class AgentState(TypedDict):
+    messages: Annotated[Sequence[BaseMessage], None]
+    query: str
+    documents: List[Document]
+
+# Attraction and restaurant retrieval are independent and I/O-bound on the
+# embedding API, so run them concurrently instead of back-to-back
+_retrieval_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="retrieval")
+
+def _retrieve_documents(query: str):
+    # Embed and tokenize once, share across both domains (string tokens so
+    # each retriever maps them onto its own vocabulary)
+    query_vec = embed_query(query)
+    query_tokens = bm25s.tokenize([query], return_ids=False, show_progress=False)
+    attr_future = _retrieval_pool.submit(hybrid_retrieval, query, "attraction", RAG_TOP_K_ATTR, query_vec, query_tokens)
+    rest_future = _retrieval_pool.submit(hybrid_retrieval, query, "restaurant", RAG_TOP_K_REST, query_vec, query_tokens)
+    return attr_future.result() + rest_future.result()
+
+def warm_up():
+    """
+    Prime the whole retrieval path: force the index/corpus load, tokenizer
+    init and one end-to-end retrieval per domain so the first real request
+    doesn't pay the cold-start cost. Called from the API startup hook.
+    """
+    get_indices()
+    _retrieve_documents("3 day trip warm up query")
+
+async def retrieve_node(state: AgentState):
+    # Async node: the blocking embedding/FAISS/BM25 work runs off the event
+    # loop so concurrent requests are not serialized behind it
+    return {"documents": await asyncio.to_thread(_retrieve_documents, state["query"])}
+
+# Invariant instructions live in a byte-identical system message so the
+# provider's automatic prompt caching can reuse the prefill across
+# requests; everything variable (query, context) comes strictly after.
+PLANNER_SYSTEM_PROMPT = (
+    "You are a professional travel planner. Create a narrative, day-by-day travel "
+    "itinerary for the trip described in the user request, grounded in the retrieved "
+    "context that follows it.\n"
+    "Formatting rules:\n"
+    "- Output the itinerary with clear Day sections using ### Day X.\n"
+    "- Within each day, structure the plan around Morning, Afternoon and Evening.\n"
+    "- Name specific attractions and restaurants from the retrieved context where "
+    "they fit; fill gaps with well-known options for the destination.\n"
+    "- Keep the plan realistic for the stated pace, dining preference and budget, "
+    "and mention approximate costs where useful.\n"
+    "- End with a short Budget Estimation Summary section."
+)
+
+# Prefill cost scales with prompt length, so cap what each retrieved doc
+# may contribute. Doc *count* is already bounded per domain by the ranked
+# RAG_TOP_K_ATTR / RAG_TOP_K_REST cuts in _retrieve_documents.
+RAG_MAX_DOC_CHARS = int(os.getenv("RAG_MAX_DOC_CHARS", "800"))
+
+def _planner_messages(state: AgentState):
+    context = "\n\n".join(d.page_content[:RAG_MAX_DOC_CHARS] for d in state["documents"])
+    return [
+        SystemMessage(content=PLANNER_SYSTEM_PROMPT),
+        HumanMessage(content=f"User request: {state['query']}\n\nRetrieved context:\n{context}"),
+    ]
+
+# Returned instead of calling the LLM when retrieval found nothing:
+# generating from an empty context burns the most expensive stage of the
+# pipeline on garbage input
+NO_CONTEXT_FALLBACK = (
+    "I couldn't find destination information matching your request. "
+    "Please check the destination spelling or try a broader trip focus."
+)
+
+def generate_node(state: AgentState):
+    if not state["documents"]:
+        return {"messages": [AIMessage(content=NO_CONTEXT_FALLBACK)], "documents": []}
+    response = agent_llm.invoke(_planner_messages(state))
+    return {"messages": [response], "documents": state["documents"]}
+
+def generate_stream(state: AgentState):
+    """
+    Yield itinerary text chunks as the LLM produces them, so callers can
+    flush output at first-token latency instead of waiting for the full
+    completion. Runs retrieval first if the state has no documents yet.
+    """
+    if not state.get("documents"):
+        state = {**state, "documents": _retrieve_documents(state["query"])}
+    if not state["documents"]:
+        yield NO_CONTEXT_FALLBACK
+        return
+    for chunk in agent_llm.stream(_planner_messages(state)):
+        if chunk.content:
+            yield chunk.content
+
+# ===============================
+# BUILD GRAPH
+# ===============================
+workflow = StateGraph(AgentState)
+workflow.add_node("retrieve", retrieve_node)
+workflow.add_node("generate", generate_node)
+workflow.set_entry_point("retrieve")
+workflow.add_edge("retrieve", "generate")
+workflow.add_edge("generate", END)
+graph = workflow.compile()
@@ -1,382 +1,622 @@
-"""
-TourGether FastAPI Backend
-Complete API for Lovable frontend integration
-"""
-
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
-from pydantic import BaseModel
-from typing import Optional, List
-import os
-import shutil
-from datetime import datetime
-from dotenv import load_dotenv
-import pandas as pd
-from io import BytesIO
-
-# ===============================
-# DOWNLOAD MODELS FIRST (before importing vision/llm_rag)
-# ===============================
-from download_models import download_all_models
-
-# Download models on first import (runs once per deployment)
-if not os.path.exists("models/best.pt") or not os.path.exists("faiss_embeddings_region"):
-    print("🔄 Models not found locally, downloading from Hugging Face...")
-    download_all_models()
-
-# Import your existing modules AFTER models are downloaded
-from vision import detect_attraction, load_model
-from llm_rag import graph
-from region_mapper import RegionMapper
-from pdf_utils import PDFGenerator
-from langchain_core.messages import HumanMessage
-
-# ===============================
-# INITIALIZATION
-# ===============================
-load_dotenv()
-
-app = FastAPI(
-    title="TourGether API",
-    description="AI-powered travel itinerary planning with vision detection",
-    version="1.0.0"
-)
-
-# CORS Configuration - Your Lovable Project
-ALLOWED_ORIGINS = [
-    "https://lovable.dev",  # Lovable development domain
-    "https://*.lovable.app",  # Published apps
-    "https://*.lovable.dev",  # All Lovable dev domains
-    "http://localhost:5173",  # Local testing
-    "http://localhost:3000"   # Alternative local port
-]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=ALLOWED_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Load vision model at startup
-MODEL_PATH = os.getenv("MODEL_PATH", "models/best.pt")
-vision_model = None
-
-@app.on_event("startup")
-async def startup_event():
-    """Load ML models on startup"""
-    global vision_model
-    try:
-        vision_model = load_model(MODEL_PATH)
-        print(f"✅ Vision model loaded from {MODEL_PATH}")
-    except Exception as e:
-        print(f"⚠️ Warning: Could not load vision model: {e}")
-
-# ===============================
-# PYDANTIC MODELS
-# ===============================
-class RegionDetectionResponse(BaseModel):
-    region: str
-    confidence: float
-    trip_type: str
-    destinations: List[str]
-    all_destinations: List[str]
-    budget_modifier: float
-    currency_hint: str
-    seasons: List[str]
-
-class ItineraryRequest(BaseModel):
-    destination: str
-    days: int
-    budget_min: int
-    budget_max: int
-    currency: str
-    trip_type: str
-    pace: str = "Moderate"
-    dining: str = "Mix of local & international"
-    region: Optional[str] = None
-
-class AttractionData(BaseModel):
-    picture: Optional[str]
-    name: Optional[str]
-
-class ItineraryResponse(BaseModel):
-    itinerary: str
-    attractions: List[AttractionData]
-    metadata: dict
-
-# ===============================
-# ENDPOINTS
-# ===============================
-
-@app.get("/")
-async def root():
-    """Health check endpoint"""
-    return {
-        "status": "running",
-        "service": "TourGether API",
-        "version": "1.0.0",
-        "endpoints": {
-            "detect_region": "/api/detect-region (POST)",
-            "generate_itinerary": "/api/generate-itinerary (POST)",
-            "generate_pdf": "/api/generate-pdf (POST)"
-        }
-    }
-
-@app.get("/health")
-async def health_check():
-    """Detailed health check"""
-    return {
-        "status": "healthy",
-        "vision_model": vision_model is not None,
-        "timestamp": datetime.now().isoformat()
-    }
-
-@app.post("/api/detect-region", response_model=RegionDetectionResponse)
-async def detect_region_endpoint(image: UploadFile = File(...)):
-    """
-    Detect region from uploaded image using YOLOv8
-    
-    Returns:
-        - region: Detected region name
-        - confidence: Detection confidence (0-1)
-        - trip_type: Suggested trip focus
-        - destinations: Top 8 suggested destinations
-        - all_destinations: All destinations for the region
-        - budget_modifier: Cost of living multiplier
-        - currency_hint: Recommended currency
-        - seasons: Best times to visit
-    """
-    if not vision_model:
-        raise HTTPException(status_code=503, detail="Vision model not available")
-    
-    try:
-        # Save uploaded file temporarily
-        temp_path = f"temp_{datetime.now().timestamp()}_{image.filename}"
-        
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        
-        # Detect region
-        region, confidence = detect_attraction(temp_path, vision_model)
-        
-        # Clean up temp file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        
-        # Get region information
-        region_info = RegionMapper.get_region_info(region)
-        trip_type = RegionMapper.get_trip_type(region, confidence)
-        destinations = RegionMapper.get_destination_suggestions(region, limit=8)
-        all_destinations = RegionMapper.get_all_destinations_for_region(region)
-        
-        return RegionDetectionResponse(
-            region=region,
-            confidence=confidence,
-            trip_type=trip_type,
-            destinations=destinations,
-            all_destinations=all_destinations,
-            budget_modifier=region_info['budget_info']['modifier'],
-            currency_hint=region_info['budget_info']['currency'],
-            seasons=region_info['season_info']
-        )
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
-
-@app.post("/api/generate-itinerary", response_model=ItineraryResponse)
-async def generate_itinerary_endpoint(request: ItineraryRequest):
-    """
-    Generate AI-powered travel itinerary using RAG
-    
-    Input:
-        - destination: City/country name
-        - days: Number of days (1-30)
-        - budget_min/max: Budget range
-        - currency: Currency code (USD, EUR, etc.)
-        - trip_type: Focus (landmarks, nature, etc.)
-        - pace: Trip pace (Relaxed/Moderate/Fast-paced)
-        - dining: Dining preference
-        - region: Optional detected region
-    
-    Returns:
-        - itinerary: Full markdown itinerary text
-        - attractions: List of featured attractions with images
-        - metadata: Trip metadata
-    """
-    try:
-        # Build budget string
-        budget_str = f"{request.currency} {request.budget_min:,} - {request.budget_max:,}"
-        
-        # Build query for LLM
-        query = f"{request.days} day trip to {request.destination} focusing on {request.trip_type}"
-        query += f" with budget {budget_str}. Pace: {request.pace}. Dining: {request.dining}."
-        
-        # Add region context if provided
-        if request.region:
-            region_name = request.region.replace('_', ' ').title()
-            query += f" (Traveler interested in {region_name} destinations)"
-        
-        # Prepare graph input
-        inputs = {
-            "messages": [HumanMessage(content=query)], 
-            "query": query,
-            "region_filter": request.region
-        }
-        
-        # Generate itinerary
-        itinerary_text = ""
-        attractions_data = []
-        
-        for output in graph.stream(inputs):
-            for node, state in output.items():
-                if node == "generate":
-                    itinerary_text = state["messages"][-1].content
-                    
-                    # Extract attraction metadata
-                    if "documents" in state:
-                        attractions_data = [
-                            AttractionData(
-                                picture=d.metadata.get("PICTURE"),
-                                name=d.metadata.get("NAME")
-                            )
-                            for d in state["documents"] 
-                            if d.metadata.get("PICTURE")
-                        ][:6]  # Limit to 6 attractions
-        
-        return ItineraryResponse(
-            itinerary=itinerary_text,
-            attractions=attractions_data,
-            metadata={
-                "destination": request.destination,
-                "days": request.days,
-                "budget": budget_str,
-                "trip_type": request.trip_type,
-                "region": request.region,
-                "generated_at": datetime.now().isoformat()
-            }
-        )
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Itinerary generation failed: {str(e)}")
-
-@app.post("/api/generate-pdf")
-async def generate_pdf_endpoint(
-    itinerary: str = Form(...),
-    destination: str = Form(...),
-    days: int = Form(...),
-    budget: str = Form(...),
-    trip_type: str = Form(...),
-    region: Optional[str] = Form(None),
-    attractions: Optional[str] = Form(None)  # JSON string of attractions
-):
-    """
-    Generate downloadable PDF from itinerary
-    
-    Input:
-        - itinerary: Full itinerary markdown text
-        - destination: City name
-        - days: Number of days
-        - budget: Budget string (e.g., "USD 2,000 - 6,000")
-        - trip_type: Trip focus
-        - region: Optional region name
-        - attractions: Optional JSON array of {picture, name}
-    
-    Returns:
-        PDF file download
-    """
-    try:
-        # Parse attractions if provided
-        attractions_df = None
-        if attractions:
-            import json
-            attractions_list = json.loads(attractions)
-            if attractions_list:
-                attractions_df = pd.DataFrame(attractions_list)
-                # Rename columns to match expected format
-                if 'picture' in attractions_df.columns:
-                    attractions_df.rename(columns={'picture': 'PICTURE', 'name': 'NAME'}, inplace=True)
-        
-        # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        pdf_filename = f"{destination.replace(' ', '_')}_{timestamp}.pdf"
-        pdf_path = f"temp_{pdf_filename}"
-        
-        # Generate PDF
-        generator = PDFGenerator()
-        success = generator.generate_pdf(
-            itinerary_text=itinerary,
-            city=destination,
-            days=days,
-            budget=budget,
-            trip_type=trip_type,
-            attractions_df=attractions_df,
-            output_path=pdf_path,
-            region=region
-        )
-        
-        if not success or not os.path.exists(pdf_path):
-            raise Exception("PDF generation failed")
-        
-        # Return file and schedule cleanup
-        response = FileResponse(
-            pdf_path,
-            media_type="application/pdf",
-            filename=pdf_filename,
-            background=None  # Cleanup handled by Railway
-        )
-        
-        return response
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"PDF generation failed: {str(e)}")
-
-@app.get("/api/regions")
-async def get_all_regions():
-    """Get all available regions and their metadata"""
-    regions = {}
-    for region in RegionMapper.REGION_TO_PREFERENCES.keys():
-        regions[region] = RegionMapper.get_region_info(region)
-    return regions
-
-@app.get("/api/destinations/{region}")
-async def get_destinations_by_region(region: str):
-    """Get all destinations for a specific region"""
-    destinations = RegionMapper.get_all_destinations_for_region(region)
-    if not destinations:
-        raise HTTPException(status_code=404, detail=f"Region '{region}' not found")
-    return {"region": region, "destinations": destinations}
-
-# ===============================
-# ERROR HANDLERS
-# ===============================
-
-@app.exception_handler(HTTPException)
-async def http_exception_handler(request, exc):
-    return JSONResponse(
-        status_code=exc.status_code,
-        content={"error": exc.detail, "status_code": exc.status_code}
-    )
-
-@app.exception_handler(Exception)
-async def general_exception_handler(request, exc):
-    return JSONResponse(
-        status_code=500,
-        content={"error": "Internal server error", "detail": str(exc)}
-    )
-
-# ===============================
-# MAIN
-# ===============================
-
-if __name__ == "__main__":
-    import uvicorn
-    port = int(os.getenv("PORT", 8000))
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=port,
-        reload=False  # Set to False in production
+"""
+TourGether FastAPI Backend
+Complete API for Lovable frontend integration
+"""
+
+from fastapi import FastAPI, Request, Response, UploadFile, File, Form, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, List
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from datetime import datetime
+from dotenv import load_dotenv
+
+# ===============================
+# DOWNLOAD MODELS FIRST (before importing vision/llm_rag)
+# ===============================
+from download_models import download_all_models
+
+# Download models on first import (runs once per deployment)
+if not os.path.exists("models/best.pt") or not os.path.exists("faiss_embeddings_region"):
+    print("🔄 Models not found locally, downloading from Hugging Face...")
+    download_all_models()
+
+# Import your existing modules AFTER models are downloaded
+from vision import detect_attraction_cached_async, load_model
+from llm_rag import graph, embed_query, warm_up, EMBED_DIM
+from region_mapper import RegionMapper
+from semantic_cache import SemanticCache
+from pdf_utils import get_generator
+from langchain_core.messages import HumanMessage
+
+# ===============================
+# INITIALIZATION
+# ===============================
+load_dotenv()
+
+app = FastAPI(
+    title="TourGether API",
+    description="AI-powered travel itinerary planning with vision detection",
+    version="1.0.0",
+    default_response_class=ORJSONResponse  # C serializer: 2-5x faster than json.dumps
+)
+
+# CORS Configuration - Your Lovable Project
+ALLOWED_ORIGINS = [
+    "https://lovable.dev",  # Lovable development domain
+    "https://*.lovable.app",  # Published apps
+    "https://*.lovable.dev",  # All Lovable dev domains
+    "http://localhost:5173",  # Local testing
+    "http://localhost:3000"   # Alternative local port
+]
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=ALLOWED_ORIGINS,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Load vision model at startup
+MODEL_PATH = os.getenv("MODEL_PATH", "models/best.pt")
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # reject pathological image uploads
+vision_model = None
+
+@app.on_event("startup")
+async def startup_event():
+    """Load ML models on startup"""
+    global vision_model
+    try:
+        # Load in a thread so the event loop answers /health probes while
+        # the weights deserialize; load_model warms the model up itself
+        vision_model = await asyncio.to_thread(load_model, MODEL_PATH)
+        print(f"✅ Vision model loaded from {MODEL_PATH}")
+    except Exception as e:
+        print(f"⚠️ Warning: Could not load vision model: {e}")
+
+    # Warm the retrieval path (index load + one retrieval per domain) so
+    # the first user request doesn't pay the cold-start cost. Disable with
+    # RAG_WARMUP=0, e.g. when iterating locally without API credits.
+    if os.getenv("RAG_WARMUP", "1") == "1":
+        try:
+            await asyncio.to_thread(warm_up)
+            print("✅ Retrieval path warmed up")
+        except Exception as e:
+            print(f"⚠️ Warning: Retrieval warm-up failed: {e}")
+
+# ===============================
+# PYDANTIC MODELS
+# ===============================
+class RegionDetectionResponse(BaseModel):
+    region: str
+    confidence: float
+    trip_type: str
+    destinations: List[str]
+    all_destinations: List[str]
+    budget_modifier: float
+    currency_hint: str
+    seasons: List[str]
+
+class ItineraryRequest(BaseModel):
+    # Length caps bound worst-case request cost: every string here flows
+    # into the embedding call and LLM prompt
+    destination: str = Field(min_length=1, max_length=200)
+    days: int = Field(ge=1, le=30)
+    budget_min: int = Field(ge=0)
+    budget_max: int = Field(ge=0, le=10_000_000)
+    currency: str = Field(max_length=10)
+    trip_type: str = Field(max_length=50)
+    pace: str = Field(default="Moderate", max_length=50)
+    dining: str = Field(default="Mix of local & international", max_length=100)
+    region: Optional[str] = Field(default=None, max_length=50)
+
+    @model_validator(mode="after")
+    def _check_budget_range(self):
+        if self.budget_max < self.budget_min:
+            raise ValueError("budget_max must be >= budget_min")
+        return self
+
+class AttractionData(BaseModel):
+    picture: Optional[str]
+    name: Optional[str]
+
+class ItineraryResponse(BaseModel):
+    itinerary: str
+    attractions: List[AttractionData]
+    metadata: dict
+
+# ===============================
+# ITINERARY RESPONSE CACHE
+# ===============================
+# Re-submitting an identical trip form used to re-embed the query, re-run
+# FAISS+BM25 and re-call the LLM every time. Cache the final answer keyed by
+# the normalized form fields and short-circuit the whole graph on a hit.
+ITINERARY_CACHE_TTL = 3600      # seconds
+ITINERARY_CACHE_MAX = 256       # entries
+
+_itinerary_cache: OrderedDict = OrderedDict()
+
+def _normalize_destination(destination: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace"""
+    cleaned = re.sub(r'[^\w\s]', '', destination.lower())
+    return re.sub(r'\s+', ' ', cleaned).strip()
+
+def _itinerary_cache_key(request: "ItineraryRequest") -> tuple:
+    """Normalized tuple key covering every field that affects the answer"""
+    return (
+        _normalize_destination(request.destination),
+        request.days,
+        request.budget_min,
+        request.budget_max,
+        request.currency,
+        request.trip_type,
+        request.pace,
+        request.dining,
+        request.region
+    )
+
+def _itinerary_cache_get(key: tuple):
+    """Return cached (itinerary_text, attractions) or None if missing/expired"""
+    entry = _itinerary_cache.get(key)
+    if entry is None:
+        return None
+    stored_at, payload = entry
+    if time.time() - stored_at > ITINERARY_CACHE_TTL:
+        del _itinerary_cache[key]
+        return None
+    _itinerary_cache.move_to_end(key)
+    return payload
+
+def _itinerary_cache_put(key: tuple, payload):
+    _itinerary_cache[key] = (time.time(), payload)
+    _itinerary_cache.move_to_end(key)
+    while len(_itinerary_cache) > ITINERARY_CACHE_MAX:
+        _itinerary_cache.popitem(last=False)
+
+# Second cache layer: near-duplicate queries that miss the exact-match cache
+# still reuse an earlier answer when their embeddings are almost identical
+_semantic_cache = SemanticCache(dim=EMBED_DIM)
+
+def _semantic_partition(request: "ItineraryRequest") -> tuple:
+    """
+    Fields a fuzzy hit must match exactly. "5 day trip to Tokyo" and
+    "7 day trip to Tokyo" embed nearly identically but need different
+    answers, so only the destination wording is left to embedding
+    similarity; every other structured form field partitions the cache,
+    with budgets coarsened into brackets.
+    """
+    return (
+        request.days,
+        request.region,
+        request.trip_type,
+        request.pace,
+        request.dining,
+        request.currency,
+        request.budget_min // 500,
+        request.budget_max // 500,
+    )
+
+def _build_llm_query(request: "ItineraryRequest", budget_str: str) -> str:
+    """Compose the natural-language query fed to the RAG graph"""
+    query = f"{request.days} day trip to {request.destination} focusing on {request.trip_type}"
+    query += f" with budget {budget_str}. Pace: {request.pace}. Dining: {request.dining}."
+    if request.region:
+        region_name = request.region.replace('_', ' ').title()
+        query += f" (Traveler interested in {region_name} destinations)"
+    return query
+
+# ===============================
+# ENDPOINTS
+# ===============================
+
+@app.get("/")
+async def root():
+    """Health check endpoint"""
+    return {
+        "status": "running",
+        "service": "TourGether API",
+        "version": "1.0.0",
+        "endpoints": {
+            "detect_region": "/api/detect-region (POST)",
+            "generate_itinerary": "/api/generate-itinerary (POST)",
+            "generate_pdf": "/api/generate-pdf (POST)"
+        }
+    }
+
+@app.get("/health")
+async def health_check():
+    """Detailed health check"""
+    return {
+        "status": "healthy",
+        "vision_model": vision_model is not None,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/detect-region", response_model=RegionDetectionResponse)
+async def detect_region_endpoint(image: UploadFile = File(...)):
+    """
+    Detect region from uploaded image using YOLOv8
+    
+    Returns:
+        - region: Detected region name
+        - confidence: Detection confidence (0-1)
+        - trip_type: Suggested trip focus
+        - destinations: Top 8 suggested destinations
+        - all_destinations: All destinations for the region
+        - budget_modifier: Cost of living multiplier
+        - currency_hint: Recommended currency
+        - seasons: Best times to visit
+    """
+    if not vision_model:
+        raise HTTPException(status_code=503, detail="Vision model not available")
+
+    # Keep the upload in memory: no temp file write/read/unlink per
+    # request, and identical re-uploads hit the detection cache. Read in
+    # chunks and bail early so an oversized upload never reaches inference.
+    chunks = []
+    received = 0
+    while chunk := await image.read(1024 * 1024):
+        received += len(chunk)
+        if received > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="Image too large (max 10 MB)")
+        chunks.append(chunk)
+    data = b"".join(chunks)
+
+    try:
+        region, confidence = await detect_attraction_cached_async(data, vision_model)
+
+        # Get region information
+        region_info = RegionMapper.get_region_info(region)
+        trip_type = RegionMapper.get_trip_type(region, confidence)
+        destinations = RegionMapper.get_destination_suggestions(region, limit=8)
+        all_destinations = RegionMapper.get_all_destinations_for_region(region)
+        
+        return RegionDetectionResponse(
+            region=region,
+            confidence=confidence,
+            trip_type=trip_type,
+            destinations=destinations,
+            all_destinations=all_destinations,
+            budget_modifier=region_info['budget_info']['modifier'],
+            currency_hint=region_info['budget_info']['currency'],
+            seasons=region_info['season_info']
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
+
+@app.post("/api/generate-itinerary", response_model=ItineraryResponse)
+async def generate_itinerary_endpoint(request: ItineraryRequest):
+    """
+    Generate AI-powered travel itinerary using RAG
+    
+    Input:
+        - destination: City/country name
+        - days: Number of days (1-30)
+        - budget_min/max: Budget range
+        - currency: Currency code (USD, EUR, etc.)
+        - trip_type: Focus (landmarks, nature, etc.)
+        - pace: Trip pace (Relaxed/Moderate/Fast-paced)
+        - dining: Dining preference
+        - region: Optional detected region
+    
+    Returns:
+        - itinerary: Full markdown itinerary text
+        - attractions: List of featured attractions with images
+        - metadata: Trip metadata
+    """
+    try:
+        # Build budget string
+        budget_str = f"{request.currency} {request.budget_min:,} - {request.budget_max:,}"
+
+        # Exact-match cache: identical form resubmissions skip the whole graph
+        cache_key = _itinerary_cache_key(request)
+        cached = _itinerary_cache_get(cache_key)
+        if cached is not None:
+            itinerary_text, attractions_data = cached
+            return ItineraryResponse(
+                itinerary=itinerary_text,
+                attractions=attractions_data,
+                metadata={
+                    "destination": request.destination,
+                    "days": request.days,
+                    "budget": budget_str,
+                    "trip_type": request.trip_type,
+                    "region": request.region,
+                    "generated_at": datetime.now().isoformat(),
+                    "cached": True
+                }
+            )
+        
+        # Build query for LLM
+        query = _build_llm_query(request, budget_str)
+
+        # Semantic cache: embedding the query is one cheap API call compared
+        # to retrieval + generation, so check for a near-duplicate hit first
+        query_vec = await asyncio.to_thread(embed_query, query)
+        semantic_hit = _semantic_cache.get(query_vec, partition=_semantic_partition(request))
+        if semantic_hit is not None:
+            itinerary_text, attractions_data = semantic_hit
+            return ItineraryResponse(
+                itinerary=itinerary_text,
+                attractions=attractions_data,
+                metadata={
+                    "destination": request.destination,
+                    "days": request.days,
+                    "budget": budget_str,
+                    "trip_type": request.trip_type,
+                    "region": request.region,
+                    "generated_at": datetime.now().isoformat(),
+                    "cached": True
+                }
+            )
+
+        # Prepare graph input
+        inputs = {
+            "messages": [HumanMessage(content=query)], 
+            "query": query,
+            "region_filter": request.region
+        }
+        
+        # Generate itinerary
+        itinerary_text = ""
+        attractions_data = []
+        
+        async for output in graph.astream(inputs):
+            for node, state in output.items():
+                if node == "generate":
+                    itinerary_text = state["messages"][-1].content
+                    
+                    # Extract attraction metadata
+                    if "documents" in state:
+                        attractions_data = [
+                            AttractionData(
+                                picture=d.metadata.get("PICTURE"),
+                                name=d.metadata.get("NAME")
+                            )
+                            for d in state["documents"] 
+                            if d.metadata.get("PICTURE")
+                        ][:6]  # Limit to 6 attractions
+
+        # Store answer for identical and near-duplicate resubmissions
+        _itinerary_cache_put(cache_key, (itinerary_text, attractions_data))
+        _semantic_cache.put(query_vec, (itinerary_text, attractions_data),
+                            partition=_semantic_partition(request))
+
+        return ItineraryResponse(
+            itinerary=itinerary_text,
+            attractions=attractions_data,
+            metadata={
+                "destination": request.destination,
+                "days": request.days,
+                "budget": budget_str,
+                "trip_type": request.trip_type,
+                "region": request.region,
+                "generated_at": datetime.now().isoformat()
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Itinerary generation failed: {str(e)}")
+
+@app.post("/api/generate-itinerary/stream")
+async def generate_itinerary_stream_endpoint(request: ItineraryRequest):
+    """
+    Stream the itinerary over Server-Sent Events as it is generated
+
+    Same input as /api/generate-itinerary, but tokens are flushed to the
+    client as the LLM produces them, so the first words appear after
+    retrieval instead of after the full generation. Events:
+        - data: {"token": "..."}        (repeated, one per LLM chunk)
+        - event: done, data: {"attractions": [...], "metadata": {...}}
+        - event: error, data: {"error": "..."}
+    """
+    budget_str = f"{request.currency} {request.budget_min:,} - {request.budget_max:,}"
+    query = _build_llm_query(request, budget_str)
+    inputs = {
+        "messages": [HumanMessage(content=query)],
+        "query": query,
+        "region_filter": request.region
+    }
+
+    async def event_stream():
+        attractions_data = []
+        try:
+            async for event in graph.astream_events(inputs, version="v2"):
+                kind = event["event"]
+                if kind == "on_chat_model_stream":
+                    token = event["data"]["chunk"].content
+                    if token:
+                        yield f"data: {json.dumps({'token': token})}\n\n"
+                elif kind == "on_chain_end" and event.get("name") == "retrieve":
+                    documents = event["data"]["output"].get("documents", [])
+                    attractions_data = [
+                        {"picture": d.metadata.get("PICTURE"), "name": d.metadata.get("NAME")}
+                        for d in documents
+                        if d.metadata.get("PICTURE")
+                    ][:6]
+            final = {
+                "attractions": attractions_data,
+                "metadata": {
+                    "destination": request.destination,
+                    "days": request.days,
+                    "budget": budget_str,
+                    "trip_type": request.trip_type,
+                    "region": request.region,
+                    "generated_at": datetime.now().isoformat()
+                }
+            }
+            yield f"event: done\ndata: {json.dumps(final)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.post("/api/generate-pdf")
+async def generate_pdf_endpoint(
+    itinerary: str = Form(...),
+    destination: str = Form(...),
+    days: int = Form(...),
+    budget: str = Form(...),
+    trip_type: str = Form(...),
+    region: Optional[str] = Form(None),
+    attractions: Optional[str] = Form(None)  # JSON string of attractions
+):
+    """
+    Generate downloadable PDF from itinerary
+    
+    Input:
+        - itinerary: Full itinerary markdown text
+        - destination: City name
+        - days: Number of days
+        - budget: Budget string (e.g., "USD 2,000 - 6,000")
+        - trip_type: Trip focus
+        - region: Optional region name
+        - attractions: Optional JSON array of {picture, name}
+    
+    Returns:
+        PDF file download
+    """
+    try:
+        # Parse attractions if provided: a plain list of dicts is all the
+        # generator needs for <=6 rows, no DataFrame required. Prefilter
+        # entries without an image so downstream never checks per row.
+        attractions_list = None
+        if attractions:
+            attractions_list = [
+                {"PICTURE": a.get("picture"), "NAME": a.get("name")}
+                for a in json.loads(attractions)
+                if a.get("picture")
+            ] or None
+        
+        # Generate unique filename
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        pdf_filename = f"{destination.replace(' ', '_')}_{timestamp}.pdf"
+
+        # Generate PDF fully in memory (blocking ReportLab + image
+        # downloads -> thread): no temp file to write, serve and unlink
+        generator = get_generator()
+        pdf_bytes = await asyncio.to_thread(
+            generator.generate_pdf,
+            itinerary_text=itinerary,
+            city=destination,
+            days=days,
+            budget=budget,
+            trip_type=trip_type,
+            attractions=attractions_list,
+            output_path=None,
+            region=region,
+        )
+
+        if not pdf_bytes:
+            raise Exception("PDF generation failed")
+
+        return Response(
+            content=pdf_bytes,
+            media_type="application/pdf",
+            headers={"Content-Disposition": f'attachment; filename="{pdf_filename}"'}
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"PDF generation failed: {str(e)}")
+
+# Region metadata is static per-process: build the full payload once at
+# import instead of recomputing it on every GET
+ALL_REGIONS_CACHE = {
+    region: RegionMapper.get_region_info(region)
+    for region in RegionMapper.REGION_TO_PREFERENCES
+}
+
+# Both GET endpoints serve immutable-per-deploy data, so let the browser
+# and any CDN keep it: ETag for revalidation, Cache-Control for freshness
+STATIC_CACHE_CONTROL = "public, max-age=3600, immutable"
+
+def _etag_for(payload) -> str:
+    return f'"{hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()}"'
+
+ALL_REGIONS_ETAG = _etag_for(ALL_REGIONS_CACHE)
+
+@lru_cache(maxsize=64)
+def _destinations_payload(region: str):
+    """(payload, etag) for a region, or None if the region is unknown"""
+    destinations = RegionMapper.get_all_destinations_for_region(region)
+    if not destinations:
+        return None
+    payload = {"region": region, "destinations": destinations}
+    return payload, _etag_for(payload)
+
+@app.get("/api/regions")
+async def get_all_regions(request: Request):
+    """Get all available regions and their metadata"""
+    if request.headers.get("if-none-match") == ALL_REGIONS_ETAG:
+        return Response(status_code=304, headers={"ETag": ALL_REGIONS_ETAG})
+    return ORJSONResponse(
+        ALL_REGIONS_CACHE,
+        headers={"Cache-Control": STATIC_CACHE_CONTROL, "ETag": ALL_REGIONS_ETAG}
+    )
+
+@app.get("/api/destinations/{region}")
+async def get_destinations_by_region(region: str, request: Request):
+    """Get all destinations for a specific region"""
+    entry = _destinations_payload(region)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Region '{region}' not found")
+    payload, etag = entry
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return ORJSONResponse(
+        payload,
+        headers={"Cache-Control": STATIC_CACHE_CONTROL, "ETag": etag}
+    )
+
+# ===============================
+# ERROR HANDLERS
+# ===============================
+
+@app.exception_handler(HTTPException)
+async def http_exception_handler(request, exc):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"error": exc.detail, "status_code": exc.status_code}
+    )
+
+@app.exception_handler(Exception)
+async def general_exception_handler(request, exc):
+    return JSONResponse(
+        status_code=500,
+        content={"error": "Internal server error", "detail": str(exc)}
+    )
+
+# ===============================
+# MAIN
+# ===============================
+
+if __name__ == "__main__":
+    import uvicorn
+    port = int(os.getenv("PORT", 8000))
+    # Multiple workers scale the CPU-bound vision + retrieval work across
+    # cores; reload forces a single worker, so it's opt-in for development
+    reload = os.getenv("DEV") == "1"
+    workers = int(os.getenv("WEB_CONCURRENCY", min(os.cpu_count() or 2, 4)))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=1 if reload else workers,
+        reload=reload
     )
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""
+One-time FAISS index migration: flat cosine -> HNSW.
+
+The shipped faiss_*_region_cosine.index files are flat (brute-force)
+inner-product indices, so every query scans all vectors x 3072 dims.
+This script rebuilds them as HNSW graphs (sub-linear search, ~0.98
+recall@10) and writes a *_hnsw.index sibling that load_faiss_bm25
+picks up automatically when present.
+
+Usage:
+    python migrate_faiss_index.py downloads/faiss_attraction_region_cosine.index [...]
+"""
+import sys
+import faiss
+
+HNSW_M = 32              # graph connectivity
+HNSW_EF_CONSTRUCTION = 200
+
+
+def migrate_to_hnsw(src_path: str, dst_path: str = None) -> str:
+    dst_path = dst_path or src_path.replace(".index", "_hnsw.index")
+    src = faiss.read_index(src_path)
+    vectors = src.reconstruct_n(0, src.ntotal)
+
+    hnsw = faiss.IndexHNSWFlat(src.d, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    hnsw.add(vectors)
+    faiss.write_index(hnsw, dst_path)
+    print(f"✅ Wrote HNSW index ({hnsw.ntotal} vectors) to {dst_path}")
+    return dst_path
+
+
+def migrate_to_sq8(src_path: str, dst_path: str = None) -> str:
+    """Re-encode FP32 vectors as 8-bit scalar-quantized (4x smaller, ~<1% recall loss)"""
+    dst_path = dst_path or src_path.replace(".index", "_sq8.index")
+    src = faiss.read_index(src_path)
+    vectors = src.reconstruct_n(0, src.ntotal)
+
+    quant = faiss.IndexScalarQuantizer(
+        src.d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+    )
+    quant.train(vectors)
+    quant.add(vectors)
+    faiss.write_index(quant, dst_path)
+    print(f"✅ Wrote SQ8 index ({quant.ntotal} vectors) to {dst_path}")
+    return dst_path
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    migrate = migrate_to_sq8 if "--sq8" in args else migrate_to_hnsw
+    for path in args:
+        if path != "--sq8":
+            migrate(path)
@@ -7,8 +7,21 @@ from reportlab.lib.units import inch
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
 from reportlab.pdfgen import canvas
 import requests
+from PIL import Image as PILImage, UnidentifiedImageError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    import httpx  # optional: enables HTTP/2 multiplexed image downloads
+except ImportError:
+    httpx = None
 from io import BytesIO
+import hashlib
+import html
+import os
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import lru_cache
 import logging
@@ -17,16 +30,157 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Second cache tier: survives process restarts, so regenerating a PDF for
+# the same city after a redeploy re-downloads nothing
+_DISK_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tourgether", "images")
+
+# Sentinel cached for URLs whose bytes can't be decoded; distinct from
+# None so a miss and a known-broken image are told apart
+_BROKEN = object()
+
+_NETWORK_ERRORS = (requests.Timeout, requests.ConnectionError)
+if httpx is not None:
+    _NETWORK_ERRORS = _NETWORK_ERRORS + (httpx.TransportError,)
+
+
+class _CompressedCanvas(canvas.Canvas):
+    """Canvas with content-stream compression on (ReportLab's default is
+    off): smaller output and fewer raw writes on long documents"""
+
+    def __init__(self, *args, **kwargs):
+        kwargs['pageCompression'] = 1
+        super().__init__(*args, **kwargs)
+
+# Compiled once at import: the parse/clean loops run these per line, and
+# re.sub/re.match with string patterns re-hits the pattern cache each call
+_RE_MD_TOKEN = re.compile(r'(\*\*\*.*?\*\*\*|\*\*.*?\*\*|\*.*?\*|__.*?__)')
+
+# One C-level alternation match classifies each line; m.lastgroup names
+# the branch, replacing the chain of per-line Python checks. Group order
+# mirrors the original elif precedence: section headers outrank time
+# markers and bullets, so "- Morning: ..." styles as a section header.
+_LINE_RE = re.compile(
+    r'(?P<sep>^[_\-=\s*·]+$)'
+    r'|(?P<day>^(?:#{1,3}\s*day\s+\d+.*|day.*))'
+    r'|(?P<section>.*\b(?:morning|afternoon|evening|night):.*)'
+    r'|(?P<time>^\d{1,2}:\d{2}.*)'
+    r'|(?P<bullet>^[•■-].*)',
+    re.IGNORECASE
+)
+
 
 class PDFGenerator:
     """Production-ready PDF generator with caching and error handling"""
     
+    IMAGE_CACHE_MAX = 50
+
     def __init__(self):
         self.styles = self._get_pdf_styles()
-        self.image_cache = {}
-        
-    def _get_pdf_styles(self):
-        """Enhanced styles with better typography"""
+        # Single bounded LRU keyed on url; successive generate_pdf calls
+        # on the same instance reuse downloads with capped memory.
+        # Entries are (resized JPEG bytes, drawWidth, drawHeight), never
+        # flowables: ReportLab flowables are stateful during doc.build,
+        # so concurrent builds must each get their own instance.
+        self.image_cache = OrderedDict()
+        # Content-hash tier: two URLs serving identical bytes (CDN
+        # mirrors, resized endpoints) share one cached entry. Bounded
+        # like the URL tier — the generator is a process-wide singleton,
+        # so an uncapped dict would grow for the life of the server.
+        self._bytes_cache = OrderedDict()
+        # The singleton is hit from asyncio.to_thread plus the prefetch
+        # pool, so every cache read/write runs under this lock
+        self._cache_lock = threading.Lock()
+        # One pooled session per generator: images for a PDF mostly come
+        # from the same CDN, so keep-alive skips a TCP+TLS handshake per
+        # fetch, and transient 5xx responses get a short retry
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': 'TourGether-PDF-Generator/1.0'})
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=20,
+            max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Prefer HTTP/2 when httpx is installed: the day images usually
+        # live on one HTTP/2 CDN, so a single multiplexed connection
+        # serves every fetch; the requests session stays as fallback
+        self.client = None
+        if httpx is not None:
+            self.client = httpx.Client(
+                http2=True,
+                # requests follows redirects by default, httpx doesn't;
+                # CDN image links commonly answer 301/302
+                follow_redirects=True,
+                timeout=httpx.Timeout(10.0, connect=3.0),
+                limits=httpx.Limits(max_keepalive_connections=10, max_connections=20),
+                headers={'User-Agent': 'TourGether-PDF-Generator/1.0'}
+            )
+
+    def _fetch(self, url, headers=None):
+        """GET a URL through the HTTP/2 client when available"""
+        if self.client is not None:
+            return self.client.get(url, headers=headers)
+        return self.session.get(url, timeout=(3, 10), headers=headers)
+
+    @staticmethod
+    def _disk_cache_paths(url):
+        key = hashlib.sha1(url.encode()).hexdigest()
+        return (os.path.join(_DISK_CACHE_DIR, key + ".bin"),
+                os.path.join(_DISK_CACHE_DIR, key + ".etag"))
+
+    def _fetch_image_bytes(self, url):
+        """
+        Image bytes for a URL, backed by the on-disk cache.
+        A cached copy without an ETag is served as-is; with an ETag we
+        revalidate via If-None-Match, so a warm 304 costs headers only.
+        """
+        bin_path, etag_path = self._disk_cache_paths(url)
+        cached = None
+        etag = None
+        if os.path.exists(bin_path):
+            with open(bin_path, "rb") as f:
+                cached = f.read()
+            if os.path.exists(etag_path):
+                with open(etag_path) as f:
+                    etag = f.read().strip()
+            if not etag:
+                logger.info(f"Using disk-cached image: {url[:50]}...")
+                return cached
+
+        logger.info(f"Downloading image: {url[:50]}...")
+        response = self._fetch(url, headers={"If-None-Match": etag} if etag else None)
+
+        if response.status_code == 304 and cached is not None:
+            return cached
+        if response.status_code != 200:
+            logger.warning(f"Failed to load image: {url}, status: {response.status_code}")
+            return cached  # stale beats nothing when the origin errors
+
+        os.makedirs(_DISK_CACHE_DIR, exist_ok=True)
+        with open(bin_path, "wb") as f:
+            f.write(response.content)
+        new_etag = response.headers.get("ETag")
+        if new_etag:
+            with open(etag_path, "w") as f:
+                f.write(new_etag)
+        return response.content
+
+    def close(self):
+        """Release the pooled HTTP connections"""
+        if self.client is not None:
+            self.client.close()
+        self.session.close()
+
+    @classmethod
+    @lru_cache(maxsize=1)
+    def _get_pdf_styles(cls):
+        """
+        Enhanced styles with better typography.
+        Built once per process: the ~10 ParagraphStyle objects are pure
+        data and safe to share, so fresh generator instances skip the
+        reconstruction cost.
+        """
         styles = getSampleStyleSheet()
         
         # Custom color palette
@@ -144,7 +298,20 @@ class PDFGenerator:
         
         return styles
     
-    @lru_cache(maxsize=50)
+    @staticmethod
+    def _flowable_from_entry(entry):
+        """
+        Fresh Image flowable for a cached (jpeg_bytes, w, h) entry.
+        Flowable._drawOn binds self.canv during draw, so a shared
+        instance drawn by two concurrent doc.build calls races onto the
+        wrong canvas; a per-call flowable over shared bytes is cheap.
+        """
+        jpeg_bytes, draw_width, draw_height = entry
+        img = Image(BytesIO(jpeg_bytes))
+        img.drawWidth = draw_width
+        img.drawHeight = draw_height
+        return img
+
     def _load_image_from_url(self, url, width=4*inch, max_height=3*inch):
         """
         Load and cache images with proper error handling
@@ -152,69 +319,112 @@ class PDFGenerator:
         """
         if not url or url == "":
             return None
-            
+
         try:
-            # Check cache first
-            if url in self.image_cache:
+            # Check cache first (including negative entries for URLs that
+            # served undecodable bytes — don't re-fetch those per day).
+            # A bare membership check could race another thread's
+            # eviction, so the hit path runs under the lock.
+            with self._cache_lock:
+                cached = self.image_cache.get(url)
+                if cached is not None:
+                    self.image_cache.move_to_end(url)
+            if cached is not None:
+                if cached is _BROKEN:
+                    return None
                 logger.info(f"Using cached image: {url[:50]}...")
-                return self.image_cache[url]
-            
-            logger.info(f"Downloading image: {url[:50]}...")
-            response = requests.get(url, timeout=10, headers={
-                'User-Agent': 'TourGether-PDF-Generator/1.0'
-            })
-            
-            if response.status_code == 200:
-                img_data = BytesIO(response.content)
-                img = Image(img_data)
-                
+                return self._flowable_from_entry(cached)
+
+            content = self._fetch_image_bytes(url)
+            if content is None:
+                return None
+
+            digest = hashlib.sha1(content).digest()
+            with self._cache_lock:
+                entry = self._bytes_cache.get(digest)
+                if entry is not None:
+                    self._bytes_cache.move_to_end(digest)
+            if entry is None:
+                # Decoding runs outside the lock: Pillow work shouldn't
+                # stall other threads' cache hits.
+                # Re-encode at the target render size (~150 DPI) first:
+                # ReportLab embeds the source bytes as-is and only scales
+                # at draw time, so a 4 MB photo shown at 4x3 inches would
+                # bloat the PDF and slow doc.build for nothing
+                target_px = (int(width / inch * 150), int(max_height / inch * 150))
+                pil = PILImage.open(BytesIO(content)).convert('RGB')
+                if pil.width > target_px[0] or pil.height > target_px[1]:
+                    pil.thumbnail(target_px, PILImage.LANCZOS)
+                img_data = BytesIO()
+                pil.save(img_data, format='JPEG', quality=82, optimize=True)
+
                 # Smart resizing - maintain aspect ratio
-                aspect = img.imageWidth / img.imageHeight
-                
+                aspect = pil.width / pil.height
+
                 if aspect > (width / max_height):
                     # Width is limiting factor
-                    img.drawWidth = width
-                    img.drawHeight = width / aspect
+                    draw_width = width
+                    draw_height = width / aspect
                 else:
                     # Height is limiting factor
-                    img.drawHeight = max_height
-                    img.drawWidth = max_height * aspect
-                
-                # Cache the image
-                self.image_cache[url] = img
-                return img
-            else:
-                logger.warning(f"Failed to load image: {url}, status: {response.status_code}")
-                return None
-                
-        except requests.Timeout:
-            logger.error(f"Timeout loading image: {url}")
+                    draw_height = max_height
+                    draw_width = max_height * aspect
+
+                entry = (img_data.getvalue(), draw_width, draw_height)
+
+            # Cache in both tiers, evicting the least recently used
+            with self._cache_lock:
+                self._bytes_cache[digest] = entry
+                while len(self._bytes_cache) > self.IMAGE_CACHE_MAX:
+                    self._bytes_cache.popitem(last=False)
+                self.image_cache[url] = entry
+                while len(self.image_cache) > self.IMAGE_CACHE_MAX:
+                    self.image_cache.popitem(last=False)
+            return self._flowable_from_entry(entry)
+
+
+        except _NETWORK_ERRORS as e:
+            # Transient: the session's Retry already took its shots, so
+            # give up for this build but leave the URL retryable
+            logger.error(f"Network error loading image {url}: {e}")
+            return None
+        except UnidentifiedImageError:
+            # Permanent for these bytes: negative-cache so later day
+            # headers referencing the same URL skip straight past it
+            logger.warning(f"Undecodable image data from {url}; skipping")
+            with self._cache_lock:
+                self.image_cache[url] = _BROKEN
             return None
         except Exception as e:
             logger.error(f"Error loading image {url}: {str(e)}")
             return None
     
     def _clean_markdown(self, text):
-        """Enhanced markdown cleaning with safety checks"""
+        """
+        Convert markdown emphasis to ReportLab tags in one pass.
+        Splitting on the combined token regex lets each fragment be either
+        wrapped or escaped exactly once — no escape-then-unescape round
+        trip, and literal <b>-like text in the source can no longer be
+        reinterpreted as markup.
+        """
         if not text:
             return ""
-        
-        # Convert markdown to ReportLab tags
-        text = re.sub(r'\*\*\*(.*?)\*\*\*', r'<b><i>\1</i></b>', text)
-        text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
-        text = re.sub(r'\*(.*?)\*', r'<i>\1</i>', text)
-        text = re.sub(r'__(.*?)__', r'<u>\1</u>', text)
-        
-        # Clean up special characters that might break PDF
-        text = text.replace('&', '&amp;')
-        text = text.replace('<', '&lt;').replace('>', '&gt;')
-        
-        # Restore our formatting tags
-        text = text.replace('&lt;b&gt;', '<b>').replace('&lt;/b&gt;', '</b>')
-        text = text.replace('&lt;i&gt;', '<i>').replace('&lt;/i&gt;', '</i>')
-        text = text.replace('&lt;u&gt;', '<u>').replace('&lt;/u&gt;', '</u>')
-        
-        return text
+
+        parts = []
+        for frag in _RE_MD_TOKEN.split(text):
+            if not frag:
+                continue
+            if frag.startswith('***') and frag.endswith('***') and len(frag) > 6:
+                parts.append(f"<b><i>{html.escape(frag[3:-3], quote=False)}</i></b>")
+            elif frag.startswith('**') and frag.endswith('**') and len(frag) > 4:
+                parts.append(f"<b>{html.escape(frag[2:-2], quote=False)}</b>")
+            elif frag.startswith('__') and frag.endswith('__') and len(frag) > 4:
+                parts.append(f"<u>{html.escape(frag[2:-2], quote=False)}</u>")
+            elif frag.startswith('*') and frag.endswith('*') and len(frag) > 2:
+                parts.append(f"<i>{html.escape(frag[1:-1], quote=False)}</i>")
+            else:
+                parts.append(html.escape(frag, quote=False))
+        return ''.join(parts)
     
     def _build_cover_page(self, city, days, budget, trip_type, region=None):
         """Create an attractive cover page"""
@@ -315,31 +525,45 @@ class PDFGenerator:
         
         return table
     
-    def _parse_itinerary_content(self, itinerary_text, attractions_df):
+    def _parse_itinerary_content(self, itinerary_text, attractions):
         """
         Smart parsing of itinerary with image placement
         Returns: story elements list
         """
         story = []
-        lines = itinerary_text.split("\n")
         day_count = 0
         current_day_elements = []
-        
-        for line in lines:
+
+        # Clean the whole text once instead of once per line: the token
+        # regex never crosses newlines, so line structure is preserved
+        # and classification still runs on the raw markdown
+        lines = itinerary_text.split("\n")
+        cleaned_lines = self._clean_markdown(itinerary_text).split("\n")
+
+        for line, cleaned in zip(lines, cleaned_lines):
             line = line.strip()
-            
-            # Skip empty lines and decorative separators
-            if not line or re.match(r'^[_\-=\s*·]+$', line):
+            if not line:
                 continue
-            
+
+            # Lowercase once per line; the handlers below read this
+            lower = line.lower()
+
             # Skip budget lines (we handle separately)
-            if "budget:" in line.lower() and "summary" not in line.lower():
+            if "budget:" in lower and "summary" not in lower:
                 continue
-            
-            formatted_line = self._clean_markdown(line)
-            
+
+            # Single classification match per line
+            m = _LINE_RE.match(line)
+            kind = m.lastgroup if m else None
+
+            # Skip decorative separators
+            if kind == "sep":
+                continue
+
+            formatted_line = cleaned.strip()
+
             # DAY HEADERS
-            if re.match(r'^#{1,3}\s*day\s+\d+', line.lower()) or line.lower().startswith("day"):
+            if kind == "day":
                 # Add previous day's elements as KeepTogether
                 if current_day_elements:
                     story.extend(current_day_elements)
@@ -351,16 +575,15 @@ class PDFGenerator:
                 story.append(Paragraph(day_title, self.styles["TG_DayHeader"]))
                 
                 # Add day image if available
-                if attractions_df is not None and not attractions_df.empty:
-                    img = self._load_image_from_url(
-                        attractions_df.iloc[day_count % len(attractions_df)].get("PICTURE")
-                    )
+                if attractions:
+                    attraction = attractions[day_count % len(attractions)]
+                    img = self._load_image_from_url(attraction.get("PICTURE"))
                     if img:
                         story.append(Spacer(1, 10))
                         story.append(img)
-                        
+
                         # Add caption if name available
-                        img_name = attractions_df.iloc[day_count % len(attractions_df)].get("NAME")
+                        img_name = attraction.get("NAME")
                         if img_name:
                             caption = Paragraph(
                                 f"<i>{img_name}</i>", 
@@ -372,24 +595,23 @@ class PDFGenerator:
                 story.append(Spacer(1, 10))
             
             # SECTION HEADERS (Morning, Afternoon, Evening)
-            elif any(x in line.lower() for x in ["morning:", "afternoon:", "evening:", "night:"]):
-                lower_line = line.lower()
-                icon = ("🌅 " if "morning" in lower_line else 
-                       "☀️ " if "afternoon" in lower_line else 
-                       "🌆 " if "evening" in lower_line else "🌙 ")
+            elif kind == "section":
+                icon = ("🌅 " if "morning" in lower else
+                       "☀️ " if "afternoon" in lower else
+                       "🌆 " if "evening" in lower else "🌙 ")
                 clean_text = formatted_line.replace("■", "").replace(":", "").strip()
                 current_day_elements.append(
                     Paragraph(icon + clean_text, self.styles["TG_SectionHeader"])
                 )
             
             # TIME MARKERS
-            elif re.match(r'^\d{1,2}:\d{2}', line):
+            elif kind == "time":
                 current_day_elements.append(
                     Paragraph(f"⏰ {formatted_line}", self.styles["TG_Time"])
                 )
             
             # ACTIVITIES
-            elif line.startswith("•") or line.startswith("■") or line.startswith("-"):
+            elif kind == "bullet":
                 clean_act = formatted_line.lstrip("•■- ").strip()
                 current_day_elements.append(
                     Paragraph(f"📍 {clean_act}", self.styles["TG_Activity"])
@@ -397,7 +619,7 @@ class PDFGenerator:
             
             # NORMAL TEXT
             else:
-                if "budget estimation summary" in line.lower():
+                if "budget estimation summary" in lower:
                     break  # Stop processing text here
                 current_day_elements.append(
                     Paragraph(formatted_line, self.styles["TG_Body"])
@@ -409,30 +631,47 @@ class PDFGenerator:
         
         return story
     
-    def generate_pdf(self, itinerary_text, city, days, budget, trip_type, 
-                    attractions_df=None, output_path="itinerary.pdf", region=None):
+    def generate_pdf(self, itinerary_text, city, days, budget, trip_type,
+                    attractions=None, output_path="itinerary.pdf", region=None):
         """
         Main PDF generation function with comprehensive error handling
-        
+
         Args:
             itinerary_text: AI-generated itinerary content
             city: Destination city
             days: Number of days
             budget: Budget range string
             trip_type: Type of trip
-            attractions_df: DataFrame with PICTURE and NAME columns
-            output_path: Output file path
+            attractions: list of dicts with PICTURE and NAME keys
+            output_path: Output file path, or None to return the PDF bytes
             region: Detected region (optional)
-        
+
         Returns:
-            bool: True if successful, False otherwise
+            bytes when output_path is None, else True on success
         """
         try:
             logger.info(f"Starting PDF generation for {city}")
+
+            # Accept a legacy DataFrame without importing pandas here
+            if hasattr(attractions, "to_dict"):
+                attractions = attractions.to_dict("records")
+
+            # Prefetch every day image in parallel: downloads overlap
+            # instead of running one-per-day inside the parse loop, which
+            # then only ever hits the warm cache
+            if attractions:
+                urls = list(dict.fromkeys(
+                    a.get("PICTURE") for a in attractions if a.get("PICTURE")
+                ))
+                if urls:
+                    with ThreadPoolExecutor(max_workers=8) as pool:
+                        list(pool.map(self._load_image_from_url, urls))
             
-            # Create document
+            # Build into memory: one bulk write (or zero, when the caller
+            # streams the bytes) instead of ReportLab's many small writes
+            buf = BytesIO()
             doc = SimpleDocTemplate(
-                output_path,
+                buf,
                 pagesize=A4,
                 rightMargin=40,
                 leftMargin=40,
@@ -451,7 +690,7 @@ class PDFGenerator:
             story.append(Paragraph("📋 Your Itinerary", self.styles["TG_SectionHeader"]))
             story.append(Spacer(1, 10))
             
-            content_elements = self._parse_itinerary_content(itinerary_text, attractions_df)
+            content_elements = self._parse_itinerary_content(itinerary_text, attractions)
             story.extend(content_elements)
             
             # 3. BUDGET SUMMARY
@@ -474,7 +713,12 @@ class PDFGenerator:
             story.append(tips)
             
             # Build PDF
-            doc.build(story)
+            doc.build(story, canvasmaker=_CompressedCanvas)
+            if output_path is None:
+                logger.info(f"PDF successfully generated in memory for {city}")
+                return buf.getvalue()
+            with open(output_path, "wb") as f:
+                f.write(buf.getbuffer())
             logger.info(f"PDF successfully generated: {output_path}")
             return True
             
@@ -483,21 +727,34 @@ class PDFGenerator:
             raise
 
 
+# ===============================
+# SHARED GENERATOR
+# ===============================
+# One process-wide instance: its image caches and pooled HTTP connections
+# persist across calls, which is exactly what a server workload wants
+_default_generator = None
+
+def get_generator() -> PDFGenerator:
+    global _default_generator
+    if _default_generator is None:
+        _default_generator = PDFGenerator()
+    return _default_generator
+
+
 # ===============================
 # LEGACY FUNCTION (for backward compatibility)
 # ===============================
-def generate_itinerary_pdf(itinerary_text, city, days, budget, trip_type, 
+def generate_itinerary_pdf(itinerary_text, city, days, budget, trip_type,
                           attractions_df=None, output_path="itinerary.pdf"):
     """
     Legacy wrapper function for backward compatibility
     """
-    generator = PDFGenerator()
-    return generator.generate_pdf(
+    return get_generator().generate_pdf(
         itinerary_text=itinerary_text,
         city=city,
         days=days,
         budget=budget,
         trip_type=trip_type,
-        attractions_df=attractions_df,
+        attractions=attractions_df,
         output_path=output_path
     )
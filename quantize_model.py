@@ -0,0 +1,64 @@
+"""
+One-time INT8 post-training quantization for the exported ONNX model.
+
+Takes the FP32 best.onnx (see OnnxYoloModel in vision.py for the export
+command) and a directory of representative sample images, and writes a
+QDQ-quantized best.int8.onnx. On VNNI-capable x86 CPUs ONNX Runtime
+then runs int8 dot-product kernels, typically 2-3x faster end-to-end
+than FP32 with >99% mAP retained. Point MODEL_PATH at the .int8.onnx
+output — the loader in vision.py handles it like any other .onnx file.
+
+Usage:
+    python quantize_model.py models/best.onnx calibration_images/
+"""
+import os
+import sys
+
+import numpy as np
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_static,
+)
+
+IMGSZ = 640
+
+
+class YoloCalibrationReader(CalibrationDataReader):
+    """Feeds preprocessed sample images to the static quantizer"""
+
+    def __init__(self, image_dir: str, input_name: str = "images"):
+        from PIL import Image
+
+        batches = []
+        for fname in sorted(os.listdir(image_dir)):
+            if not fname.lower().endswith((".jpg", ".jpeg", ".png")):
+                continue
+            img = Image.open(os.path.join(image_dir, fname)).convert("RGB")
+            img = img.resize((IMGSZ, IMGSZ))
+            x = np.asarray(img, dtype=np.float32).transpose(2, 0, 1)[None] / 255.0
+            batches.append({input_name: x})
+        self._iterator = iter(batches)
+
+    def get_next(self):
+        return next(self._iterator, None)
+
+
+def quantize(model_path: str, calib_dir: str, output_path: str = None) -> str:
+    output_path = output_path or model_path.replace(".onnx", ".int8.onnx")
+    quantize_static(
+        model_input=model_path,
+        model_output=output_path,
+        calibration_data_reader=YoloCalibrationReader(calib_dir),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    print(f"✅ Wrote INT8 model to {output_path}")
+    return output_path
+
+
+if __name__ == "__main__":
+    quantize(sys.argv[1], sys.argv[2])
@@ -4,17 +4,21 @@
 # Save as: region_mapper.py
 # ===============================
 
-class RegionMapper:
-    """
-    Maps vision-detected regions to trip preferences and destinations.
-    
-    ARCHITECTURE DECISION:
-    - Region filtering happens at RETRIEVAL layer (FAISS/BM25)
-    - NOT in LLM prompt (that would constrain creativity)
-    - UI shows suggestions but lets user decide
-    - Budget adjustment is suggested, not forced
-    """
-    
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class RegionInfo:
+    """Immutable per-region record: attribute reads replace the nested
+    dict hashing every lookup used to pay"""
+    primary_type: str
+    secondary_types: tuple
+    suggested_destinations: tuple
+    budget_modifier: float
+    currency_hint: str
+    popular_seasons: tuple
+
+
 class RegionMapper:
     """
     Maps vision-detected regions to trip preferences and destinations.
@@ -141,93 +145,111 @@ class RegionMapper:
         }
     }
     
-    @classmethod
-    def get_trip_type(cls, region: str, confidence: float = 1.0) -> str:
+    @staticmethod
+    def get_trip_type(region: str, confidence: float = 1.0) -> str:
         """Get primary trip type from detected region"""
-        if region not in cls.REGION_TO_PREFERENCES:
-            return 'landmarks'  # Default fallback
-        
-        mapping = cls.REGION_TO_PREFERENCES[region]
-        
-        # If confidence is low, suggest multiple options
-        if confidence < 0.6:
-            return mapping['primary_type']  # Still return primary but flag for user
-        
-        return mapping['primary_type']
-    
-    @classmethod
-    def get_destination_suggestions(cls, region: str, limit: int = 8) -> list:
+        return _REGIONS.get(region, _DEFAULT_REGION).primary_type
+
+    @staticmethod
+    def get_destination_suggestions(region: str, limit: int = 8) -> list:
         """
         Get destination suggestions based on region
-        
+
         Args:
             region: Detected region name
             limit: Maximum number of suggestions to return
-        
+
         Returns:
             List of suggested destination names
         """
-        if region not in cls.REGION_TO_PREFERENCES:
+        info = _REGIONS.get(region)
+        if info is None:
             return []
-        return cls.REGION_TO_PREFERENCES[region]['suggested_destinations'][:limit]
-    
-    @classmethod
-    def get_all_destinations_for_region(cls, region: str) -> list:
+        return list(info.suggested_destinations[:limit])
+
+    @staticmethod
+    def get_all_destinations_for_region(region: str) -> list:
         """Get all available destinations for a region"""
-        if region not in cls.REGION_TO_PREFERENCES:
+        info = _REGIONS.get(region)
+        if info is None:
             return []
-        return cls.REGION_TO_PREFERENCES[region]['suggested_destinations']
-    
-    @classmethod
-    def get_region_info(cls, region: str) -> dict:
+        return list(info.suggested_destinations)
+
+    @staticmethod
+    def get_region_info(region: str) -> dict:
         """
         Get comprehensive region information
-        
+
         Returns dict with:
         - destinations: list of suggested cities
         - trip_types: primary and secondary
         - budget_info: modifier and currency hint
         - season_info: best times to visit
         """
-        if region not in cls.REGION_TO_PREFERENCES:
-            return {
-                'destinations': [],
-                'trip_types': {'primary': 'landmarks', 'secondary': []},
-                'budget_info': {'modifier': 1.0, 'currency': 'USD'},
-                'season_info': ['Year-round']
-            }
-        
-        mapping = cls.REGION_TO_PREFERENCES[region]
-        return {
-            'destinations': mapping['suggested_destinations'],
-            'trip_types': {
-                'primary': mapping['primary_type'],
-                'secondary': mapping['secondary_types']
-            },
-            'budget_info': {
-                'modifier': mapping['budget_modifier'],
-                'currency': mapping.get('currency_hint', 'USD')
-            },
-            'season_info': mapping.get('popular_seasons', ['Year-round'])
-        }
-    
-    @classmethod
-    def adjust_budget(cls, region: str, budget_range: tuple) -> tuple:
+        return _REGION_INFO.get(region, _DEFAULT_REGION_INFO)
+
+    @staticmethod
+    def adjust_budget(region: str, budget_range: tuple) -> tuple:
         """Adjust budget based on region cost"""
-        if region not in cls.REGION_TO_PREFERENCES:
+        info = _REGIONS.get(region)
+        if info is None:
             return budget_range
-        
-        modifier = cls.REGION_TO_PREFERENCES[region]['budget_modifier']
-        return (int(budget_range[0] * modifier), int(budget_range[1] * modifier))
-    
+        return (int(budget_range[0] * info.budget_modifier),
+                int(budget_range[1] * info.budget_modifier))
+
     @classmethod
     def get_enriched_query_context(cls, region: str) -> str:
         """Get additional context for RAG query based on region"""
-        if region not in cls.REGION_TO_PREFERENCES:
-            return ""
-        
-        mapping = cls.REGION_TO_PREFERENCES[region]
-        context = f"Region: {region.replace('_', ' ').title()}. "
-        context += f"Focus on {mapping['primary_type'].replace('_', ' ')} "
-        context += f"and consider {', '.join(mapping['secondary_types'])}."
-        return context
+        return _ENRICHED_CONTEXTS.get(region, "")
+
+
+# ===============================
+# FROZEN LOOKUPS (built once at import)
+# ===============================
+_REGIONS = {
+    name: RegionInfo(
+        primary_type=prefs['primary_type'],
+        secondary_types=tuple(prefs['secondary_types']),
+        suggested_destinations=tuple(prefs['suggested_destinations']),
+        budget_modifier=prefs['budget_modifier'],
+        currency_hint=prefs.get('currency_hint', 'USD'),
+        popular_seasons=tuple(prefs.get('popular_seasons', ['Year-round'])),
+    )
+    for name, prefs in RegionMapper.REGION_TO_PREFERENCES.items()
+}
+
+_DEFAULT_REGION = RegionInfo(
+    primary_type='landmarks',
+    secondary_types=(),
+    suggested_destinations=(),
+    budget_modifier=1.0,
+    currency_hint='USD',
+    popular_seasons=('Year-round',),
+)
+
+def _region_info_dict(info: RegionInfo) -> dict:
+    return {
+        'destinations': list(info.suggested_destinations),
+        'trip_types': {
+            'primary': info.primary_type,
+            'secondary': list(info.secondary_types)
+        },
+        'budget_info': {
+            'modifier': info.budget_modifier,
+            'currency': info.currency_hint
+        },
+        'season_info': list(info.popular_seasons)
+    }
+
+_REGION_INFO = {name: _region_info_dict(info) for name, info in _REGIONS.items()}
+_DEFAULT_REGION_INFO = _region_info_dict(_DEFAULT_REGION)
+
+# Enriched RAG contexts are pure functions of static data — precompute
+_ENRICHED_CONTEXTS = {
+    name: (
+        f"Region: {name.replace('_', ' ').title()}. "
+        f"Focus on {info.primary_type.replace('_', ' ')} "
+        f"and consider {', '.join(info.secondary_types)}."
+    )
+    for name, info in _REGIONS.items()
+}
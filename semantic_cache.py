@@ -0,0 +1,73 @@
+"""
+Semantic response cache for generated itineraries.
+
+Near-duplicate queries ("3 day Tokyo landmarks" vs "3-day Tokyo trip
+landmarks") miss an exact-match cache but still pay the full retrieval
++ LLM cost. This cache keys on the query embedding instead: stored
+embeddings live in one L2-normalized float32 matrix, so a lookup is a
+single matrix-vector product, and anything above the cosine threshold
+returns the stored response without touching the graph.
+
+Fuzzy matching is only safe for the free-text part of a query. Fields
+like the day count are near-invisible to the embedding ("5 day trip to
+Tokyo" vs "7 day trip to Tokyo" clears any workable threshold) but
+completely change the right answer, so entries carry an exact-match
+partition key and lookups only score rows in the same partition.
+"""
+import time
+
+import numpy as np
+
+SIM_THRESHOLD = 0.95
+MAX_ENTRIES = 2000
+TTL_SECONDS = 24 * 3600
+
+
+class SemanticCache:
+    """Embedding-similarity cache mapping query vectors to responses"""
+
+    def __init__(self, dim, threshold=SIM_THRESHOLD, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.dim = dim
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._matrix = np.empty((0, dim), dtype="float32")
+        self._entries = []     # parallel to matrix rows: (stored_at, payload)
+        self._partitions = []  # parallel: exact-match key per row
+
+    @staticmethod
+    def _unit(vec):
+        vec = np.asarray(vec, dtype="float32").reshape(-1)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _evict(self):
+        """Drop expired rows, then oldest rows past the size cap"""
+        now = time.time()
+        keep = [i for i, (stored_at, _) in enumerate(self._entries)
+                if now - stored_at <= self.ttl]
+        if len(keep) > self.max_entries:
+            keep = keep[len(keep) - self.max_entries:]
+        if len(keep) != len(self._entries):
+            self._matrix = self._matrix[keep]
+            self._entries = [self._entries[i] for i in keep]
+            self._partitions = [self._partitions[i] for i in keep]
+
+    def get(self, query_vec, partition=None):
+        """Return the cached payload for the most similar query stored
+        under the same partition key, or None"""
+        self._evict()
+        rows = [i for i, p in enumerate(self._partitions) if p == partition]
+        if not rows:
+            return None
+        scores = self._matrix[rows] @ self._unit(query_vec)
+        best = int(scores.argmax())
+        if scores[best] < self.threshold:
+            return None
+        return self._entries[rows[best]][1]
+
+    def put(self, query_vec, payload, partition=None):
+        self._matrix = np.vstack([self._matrix, self._unit(query_vec)[None, :]])
+        self._entries.append((time.time(), payload))
+        self._partitions.append(partition)
+        self._evict()
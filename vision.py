@@ -1,59 +1,447 @@
+import ast
+import asyncio
+import hashlib
 import os
 import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
 from ultralytics import YOLO
 
 # Set up logging to see what's happening in Railway logs
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Global variable to hold the loaded model (Singleton pattern)
-_vision_model = None
+# Resolved once: the fallback model path shouldn't cost an env lookup
+# on every uncached detection
+_DEFAULT_MODEL_PATH = os.getenv("MODEL_PATH", "models/best.pt")
+
+_ERROR_LOG_EVERY = 50
+_error_counts = {}
+
+def _log_inference_error(label, exc):
+    """Log the first error of each kind, then one in every 50: a burst
+    of bad uploads shouldn't serialize workers on the logging lock"""
+    n = _error_counts.get(label, 0) + 1
+    _error_counts[label] = n
+    if n == 1 or n % _ERROR_LOG_EVERY == 0:
+        logger.error("%s (%d so far): %s", label, n, exc)
+
+
+class OnnxYoloModel:
+    """
+    Minimal ONNX Runtime wrapper for a YOLO detector.
+    ORT fuses Conv+BN+SiLU and runs optimized MLAS kernels, typically
+    2-4x faster than the generic PyTorch ops on CPU.
+
+    Export once offline with:
+        YOLO("models/best.pt").export(format="onnx", opset=17, simplify=True, imgsz=640)
+    then point MODEL_PATH at the .onnx file.
+    """
+
+    # Matches the default NMS confidence cutoff on the PyTorch path, so
+    # both backends reject weak detections the same way
+    CONF_THRESHOLD = 0.25
+
+    def __init__(self, session, names, imgsz=640):
+        self.session = session
+        self.names = names
+        self.imgsz = imgsz
+        self.input_name = session.get_inputs()[0].name
+
+    def _preprocess(self, image):
+        from PIL import Image
+        if isinstance(image, np.ndarray):
+            img = Image.fromarray(image)
+        elif isinstance(image, Image.Image):
+            img = image
+        else:
+            img = Image.open(image)
+        img = img.convert("RGB").resize((self.imgsz, self.imgsz))
+        # Stay uint8 through the (free) transpose view, then convert,
+        # scale and make contiguous in one fused ufunc sweep instead of
+        # separate float32-cast and divide passes over the image
+        x = np.asarray(img).transpose(2, 0, 1)[None]
+        return np.multiply(x, np.float32(1 / 255), dtype=np.float32)
+
+    def detect_top1(self, image):
+        """Return (label, confidence) for the strongest detection"""
+        x = self._preprocess(image)
+        # Output shape: (1, 4 + num_classes, num_anchors)
+        out = self.session.run(None, {self.input_name: x})[0]
+        scores = out[0, 4:, :]
+        best_anchor = int(scores.max(axis=0).argmax())
+        class_id = int(scores[:, best_anchor].argmax())
+        confidence = float(scores[class_id, best_anchor])
+        if confidence < self.CONF_THRESHOLD:
+            return "Unknown", 0.0
+        return self.names.get(class_id, str(class_id)), confidence
+
+
+def _cpu_supports_vnni() -> bool:
+    """True when the host CPU has AVX-512 VNNI int8 dot-product kernels"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            return "avx512_vnni" in f.read()
+    except OSError:
+        # Non-Linux dev machines: assume capable rather than silently
+        # degrading to FP32
+        return True
+
+
+def _load_onnx_model(model_path: str) -> OnnxYoloModel:
+    import onnxruntime as ort
+
+    so = ort.SessionOptions()
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # Split cores across uvicorn workers so N sessions don't oversubscribe
+    # the machine; ORT_INTRA_OP_THREADS overrides the derived default
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    default_threads = max(1, (os.cpu_count() or 1) // max(1, workers))
+    so.intra_op_num_threads = int(os.getenv("ORT_INTRA_OP_THREADS", default_threads))
+    session = ort.InferenceSession(
+        model_path, providers=["CPUExecutionProvider"], sess_options=so
+    )
+    # Ultralytics exports embed the class-name map in the model metadata
+    meta = session.get_modelmeta().custom_metadata_map
+    names = ast.literal_eval(meta.get("names", "{}"))
+    return OnnxYoloModel(session, names)
+
+
+@contextmanager
+def _mmap_torch_load():
+    """
+    Make torch.load mmap checkpoint weights for the duration of the
+    block. Ultralytics doesn't expose the flag, so this wraps the call
+    it makes internally: the kernel then pages weights in on demand and
+    shares the mapping across uvicorn workers instead of each worker
+    reading a full private copy into RAM. Falls back to a plain load on
+    torch builds or checkpoint formats that reject mmap.
+    """
+    import torch
+
+    orig_load = torch.load
+
+    def load(*args, **kwargs):
+        kwargs.setdefault("mmap", True)
+        try:
+            return orig_load(*args, **kwargs)
+        except (TypeError, RuntimeError):
+            kwargs.pop("mmap", None)
+            return orig_load(*args, **kwargs)
+
+    torch.load = load
+    try:
+        yield
+    finally:
+        torch.load = orig_load
+
+
+def _maybe_build_tensorrt(model_path: str):
+    """
+    Cached TensorRT engine path for a .pt checkpoint, or None off-GPU.
+    Engines are tactic-tuned per device, so the cache filename carries
+    the GPU name; the one-off export cost is paid on first boot only.
+    """
+    try:
+        import torch
+        if not torch.cuda.is_available():
+            return None
+        device = torch.cuda.get_device_name(0).replace(" ", "_")
+        engine_path = os.path.splitext(model_path)[0] + f"_{device}.engine"
+        if not os.path.exists(engine_path):
+            logger.info("🔄 Building TensorRT engine (one-off per GPU)...")
+            exported = YOLO(model_path).export(
+                format='engine', half=True, simplify=True, workspace=4, imgsz=640
+            )
+            os.replace(exported, engine_path)
+        return engine_path
+    except Exception as e:
+        logger.warning(f"⚠️ TensorRT engine unavailable, using {model_path}: {e}")
+        return None
+
 
+@lru_cache(maxsize=1)
 def load_model(model_path: str):
     """
-    Loads the YOLO model into memory. 
-    Using a global variable ensures we don't load it multiple times.
+    Loads the YOLO model into memory.
+    lru_cache makes this a lazy per-path singleton: nothing loads until
+    the first call, and every caller shares the same instance.
     """
-    global _vision_model
-    
-    if _vision_model is not None:
-        return _vision_model
-    
     if not os.path.exists(model_path):
         logger.error(f"❌ Model file not found at {model_path}")
         raise FileNotFoundError(f"Model file {model_path} is missing. Check download logs.")
-    
+
     try:
         logger.info(f"🔄 Loading YOLO model from {model_path}...")
-        # Use task='detect' to be explicit
-        _vision_model = YOLO(model_path, task='detect')
-        logger.info("✅ Vision model loaded successfully.")
-        return _vision_model
+        try:
+            import torch
+            if torch.cuda.is_available():
+                # Fixed 640x640 input shape: let cuDNN autotune convs
+                torch.backends.cudnn.benchmark = True
+        except ImportError:
+            pass
+        if model_path.endswith(".xml") or model_path.rstrip("/").endswith("_openvino_model"):
+            # OpenVINO IR, exported offline with:
+            #     pip install openvino
+            #     YOLO("models/best.pt").export(format="openvino", int8=True)
+            # ultralytics' AutoBackend drives openvino.Core under the
+            # hood; on Railway's Intel Xeons the int8 CPU kernels
+            # typically beat ONNX Runtime by ~30% for YOLO. openvino is
+            # deliberately not in requirements.txt — install it in the
+            # deploy image only when pointing MODEL_PATH at an IR export.
+            model = YOLO(model_path, task='detect')
+        elif model_path.endswith(".onnx"):
+            # INT8 only beats FP32 on VNNI-capable CPUs; elsewhere the
+            # QDQ graph regresses, so prefer the FP32 export if present
+            if model_path.endswith(".int8.onnx") and not _cpu_supports_vnni():
+                fp32_path = model_path.replace(".int8.onnx", ".onnx")
+                if os.path.exists(fp32_path):
+                    logger.warning(
+                        f"⚠️ CPU lacks avx512_vnni, using FP32 model {fp32_path}"
+                    )
+                    model_path = fp32_path
+            try:
+                model = _load_onnx_model(model_path)
+            except ImportError:
+                # onnxruntime not installed: fall back to the PyTorch
+                # weights next to the export instead of failing the boot
+                pt_path = os.path.splitext(model_path)[0] + ".pt"
+                logger.warning(f"⚠️ onnxruntime unavailable, falling back to {pt_path}")
+                model = YOLO(pt_path, task='detect')
+        else:
+            # On GPU hosts, swap the .pt for a cached FP16 TensorRT
+            # engine; on the CPU deployment this is a no-op
+            engine_path = _maybe_build_tensorrt(model_path)
+            if engine_path is not None:
+                model = YOLO(engine_path, task='detect')
+            else:
+                # Use task='detect' to be explicit
+                with _mmap_torch_load():
+                    model = YOLO(model_path, task='detect')
+                # Merge Conv+BN pairs: fewer ops and less memory traffic
+                # per forward pass on the eager PyTorch path
+                model.fuse()
+                # torch.compile shaves another 10-25% but its first-call
+                # compilation takes minutes on small CPU instances, so
+                # it stays opt-in
+                if os.getenv("VISION_TORCH_COMPILE", "0") == "1":
+                    try:
+                        import torch
+                        model.model = torch.compile(
+                            model.model, mode='reduce-overhead', fullgraph=False
+                        )
+                    except Exception as compile_err:
+                        logger.warning(f"⚠️ torch.compile unavailable: {compile_err}")
+        # The first forward pass pays one-off lazy init (algo selection,
+        # buffer allocation, tactic caches); burn it here so the first
+        # real request serves at steady-state latency
+        # max_det=1/agnostic_nms bake into the persistent predictor: the
+        # callers only ever read the top-1 box, so there is no point
+        # building Boxes objects for every surviving detection. half
+        # persists FP16 weights on GPU hosts (halved memory bandwidth);
+        # FP16 regresses on CPU, so it stays off there.
+        try:
+            import torch
+            use_half = torch.cuda.is_available()
+        except ImportError:
+            use_half = False
+        dummy = np.zeros((640, 640, 3), dtype=np.uint8)
+        for _ in range(2):
+            if isinstance(model, OnnxYoloModel):
+                model.detect_top1(dummy)
+            else:
+                model(dummy, verbose=False, max_det=1, agnostic_nms=True,
+                      half=use_half)
+        logger.info("✅ Vision model loaded and warmed up.")
+        return model
     except Exception as e:
         logger.error(f"❌ Failed to load YOLO model: {e}")
         raise
 
-def detect_attraction(image_path: str, model=None):
+# Photos larger than this get shrunk before inference: the detector
+# resizes to its own imgsz anyway, so feeding it 4K pixels only wastes
+# decode and resampling time
+_MAX_INFERENCE_SIDE = 1280
+
+def _as_inference_input(image):
+    """Accept a file path, raw bytes, PIL image or ndarray"""
+    if isinstance(image, (bytes, bytearray)):
+        from io import BytesIO
+        from PIL import Image
+        img = Image.open(BytesIO(image)).convert("RGB")
+        if max(img.size) > _MAX_INFERENCE_SIDE:
+            img.thumbnail((_MAX_INFERENCE_SIDE, _MAX_INFERENCE_SIDE))
+        return img
+    return image
+
+# Detection results keyed by image content hash: re-uploads of the same
+# photo (retries, re-runs) skip YOLO inference entirely
+_DETECT_CACHE_MAX = 64
+_detect_cache = OrderedDict()
+_detect_cache_hits = 0
+_detect_cache_lookups = 0
+
+def _record_cache_lookup(hit: bool):
+    """Log the hit rate every 100 lookups so ops can size the cache
+    against real traffic"""
+    global _detect_cache_hits, _detect_cache_lookups
+    _detect_cache_lookups += 1
+    if hit:
+        _detect_cache_hits += 1
+    if _detect_cache_lookups % 100 == 0:
+        logger.info(
+            "Detection cache hit rate: %d/%d (%.0f%%)",
+            _detect_cache_hits, _detect_cache_lookups,
+            100 * _detect_cache_hits / _detect_cache_lookups,
+        )
+
+def detect_attraction_cached(image_bytes: bytes, model=None):
+    """
+    Memoized detect_attraction for raw image bytes.
+    Hashing is ~free compared to the hundreds of ms of CPU inference.
+    """
+    key = hashlib.blake2b(image_bytes, digest_size=16).digest()
+    cached = _detect_cache.get(key)
+    _record_cache_lookup(cached is not None)
+    if cached is not None:
+        _detect_cache.move_to_end(key)
+        return cached
+
+    result = detect_attraction(image_bytes, model)
+    if result[0] != "Error":
+        _detect_cache[key] = result
+        while len(_detect_cache) > _DETECT_CACHE_MAX:
+            _detect_cache.popitem(last=False)
+    return result
+
+def detect_attraction(image, model=None):
     """
-    Run inference on an image. 
+    Run inference on an image (path, raw bytes, PIL image or ndarray).
     Accepts an optional model instance to avoid re-loading.
+    Decoding uploads in memory skips the temp-file disk round-trip.
     """
     if model is None:
         # Fallback if no model is passed, though main.py should provide it
-        model = load_model(os.getenv("MODEL_PATH", "models/best.pt"))
-    
+        model = load_model(_DEFAULT_MODEL_PATH)
+
     try:
-        results = model(image_path)
-        
-        # Extract the top detected class and confidence
-        if len(results) > 0 and len(results[0].boxes) > 0:
-            top_box = results[0].boxes[0]
-            class_id = int(top_box.cls[0])
-            label = model.names[class_id]
-            confidence = float(top_box.conf[0])
-            return label, confidence
-        
+        image = _as_inference_input(image)
+        if isinstance(model, OnnxYoloModel):
+            return model.detect_top1(image)
+
+        results = _run_inference(model, image)
+        return _top1_from_result(model, results[0]) if len(results) > 0 else ("Unknown", 0.0)
+    except Exception as e:
+        _log_inference_error("Inference error", e)
+        return "Error", 0.0
+
+def _run_inference(model, source):
+    """
+    Run an ultralytics forward pass through the predictor the warm-up
+    call in load_model materialized. Calling the predictor directly
+    skips YOLO.__call__'s per-call argument re-parsing and Results-list
+    setup, which is measurable overhead once inference itself is fast.
+    """
+    predictor = getattr(model, "predictor", None)
+    if predictor is not None:
+        return predictor(source=source, stream=False)
+    return model(source, verbose=False)
+
+def _top1_from_result(model, result):
+    """(label, confidence) of the strongest box in one ultralytics result"""
+    if len(result.boxes) == 0:
         return "Unknown", 0.0
+    top_box = result.boxes[0]
+    class_id = int(top_box.cls[0])
+    return model.names[class_id], float(top_box.conf[0])
+
+def detect_attraction_batch(images, model=None):
+    """
+    Run inference on a list of images as one batched forward pass,
+    amortizing the per-call Python and dispatch overhead across the
+    batch. Returns a list of (label, confidence) tuples, one per image.
+    """
+    if model is None:
+        model = load_model(_DEFAULT_MODEL_PATH)
+
+    try:
+        inputs = [_as_inference_input(img) for img in images]
+        if isinstance(model, OnnxYoloModel):
+            return [model.detect_top1(x) for x in inputs]
+        results = _run_inference(model, inputs)
+        return [_top1_from_result(model, r) for r in results]
     except Exception as e:
-        logger.error(f"Inference error: {e}")
-        return "Error", 0.0
\ No newline at end of file
+        _log_inference_error("Batch inference error", e)
+        return [("Error", 0.0)] * len(images)
+
+# Micro-batching: concurrent requests landing within a few ms are
+# coalesced into one detect_attraction_batch call, amortizing the fixed
+# per-inference dispatch cost instead of paying it once per request
+_BATCH_MAX = 8
+_BATCH_WINDOW_S = 0.005
+_batch_queue = None
+_batch_worker_task = None
+
+async def detect_attraction_async(image, model=None):
+    """
+    Async detect_attraction that coalesces concurrent callers into one
+    batched forward pass. The batcher task is created lazily on first
+    use so it binds to the serving event loop.
+    """
+    global _batch_queue, _batch_worker_task
+    if _batch_queue is None:
+        _batch_queue = asyncio.Queue()
+        _batch_worker_task = asyncio.create_task(_drain_batches())
+    future = asyncio.get_running_loop().create_future()
+    await _batch_queue.put((image, model, future))
+    return await future
+
+async def _drain_batches():
+    while True:
+        batch = [await _batch_queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + _BATCH_WINDOW_S
+        # Keep collecting until the window closes or the batch is full
+        while len(batch) < _BATCH_MAX:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_batch_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # The drain loop must survive any failure (e.g. load_model
+        # raising before detect_attraction_batch's own try block): a
+        # dead worker would strand every pending and future request,
+        # since the queue existing stops a replacement being created
+        try:
+            results = await asyncio.to_thread(
+                detect_attraction_batch, [item[0] for item in batch], batch[0][1]
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+async def detect_attraction_cached_async(image_bytes: bytes, model=None):
+    """Async, content-hash-cached variant used by the upload endpoint"""
+    key = hashlib.blake2b(image_bytes, digest_size=16).digest()
+    cached = _detect_cache.get(key)
+    _record_cache_lookup(cached is not None)
+    if cached is not None:
+        _detect_cache.move_to_end(key)
+        return cached
+
+    result = await detect_attraction_async(image_bytes, model)
+    if result[0] != "Error":
+        _detect_cache[key] = result
+        while len(_detect_cache) > _DETECT_CACHE_MAX:
+            _detect_cache.popitem(last=False)
+    return result
\ No newline at end of file